@@ -0,0 +1,43 @@
+"""key this_day_cache by privacy and tree revision
+
+Revision ID: d4e5f6g7h8i9
+Revises: c3d4e5f6g7h8
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e5f6g7h8i9'
+down_revision = 'c3d4e5f6g7h8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing digests were not keyed by privacy, so their visibility is
+    # unknown. They are only a cache and are regenerated on demand.
+    op.execute("DELETE FROM this_day_cache")
+    op.drop_index('idx_this_day_tree_month_day', table_name='this_day_cache')
+    op.add_column(
+        'this_day_cache',
+        sa.Column('include_private', sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+    op.add_column(
+        'this_day_cache',
+        sa.Column('tree_revision', sa.Float(precision=53), nullable=True),
+    )
+    op.create_index(
+        'idx_this_day_tree_month_day',
+        'this_day_cache',
+        ['tree', 'month_day', 'include_private'],
+    )
+
+
+def downgrade():
+    op.drop_index('idx_this_day_tree_month_day', table_name='this_day_cache')
+    op.drop_column('this_day_cache', 'tree_revision')
+    op.drop_column('this_day_cache', 'include_private')
+    op.create_index('idx_this_day_tree_month_day', 'this_day_cache', ['tree', 'month_day'])
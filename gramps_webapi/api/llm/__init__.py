@@ -4,15 +4,16 @@ from __future__ import annotations
 
 import os
 import re
+from collections import defaultdict
 from typing import Any
 
 from flask import current_app
-from google import genai
 from google.genai import types
 
 from ..util import abort_with_message, get_logger
-from .agent import run_agent, _ToolContext
+from .agent import run_agent, _get_client, _get_service_tier, _ToolContext
 from .deps import AgentDeps
+from .grounding_policy import decide_chat_grounding
 from .tools import (
     get_tree_statistics,
     find_coincidences_and_clusters,
@@ -42,6 +43,17 @@ RULES:
 - Each paragraph = one observation, written in plain prose with personality."""
 
 
+def warm_up(api_key: str | None, service_tier: str | None = None) -> None:
+    """Create the Gemini client ahead of the first AI request.
+
+    Importing this module already builds the tool declarations. The service
+    tier is checked here, so an unsupported setting is logged right away.
+    """
+    if api_key:
+        _get_client(api_key)
+    _get_service_tier(service_tier)
+
+
 def sanitize_answer(answer: str) -> str:
     """Sanitize the LLM answer."""
     # some models convert relative URLs to absolute URLs with placeholder domains
@@ -146,10 +158,15 @@ def answer_with_agent(
     model_name = config.get("LLM_MODEL")
     max_context_length = config.get("LLM_MAX_CONTEXT_LENGTH", 50000)
     system_prompt_override = config.get("LLM_SYSTEM_PROMPT")
+    context_cache_ttl = config.get("LLM_CONTEXT_CACHE_TTL", 0)
+    service_tier = config.get("LLM_SERVICE_TIER")
+    max_iterations = config.get("LLM_MAX_ITERATIONS", 10)
 
     if not model_name:
         raise ValueError("No LLM model specified")
 
+    grounding = decide_chat_grounding(config.get("LLM_SEARCH_GROUNDING"), prompt)
+
     deps = AgentDeps(
         tree=tree,
         include_private=include_private,
@@ -162,13 +179,21 @@ def answer_with_agent(
         gemini_history = _convert_history_to_gemini(history)
 
     try:
-        logger.debug("Running Gemini agent with prompt: '%s'", prompt)
+        logger.debug(
+            "Running Gemini agent with prompt: '%s' (Google Search: %s)",
+            prompt,
+            grounding["use_search"],
+        )
         response = run_agent(
             prompt=prompt,
             deps=deps,
             model_name=model_name,
             system_prompt_override=system_prompt_override,
             history=gemini_history,
+            context_cache_ttl=context_cache_ttl,
+            google_search=grounding["use_search"],
+            service_tier=service_tier,
+            max_iterations=max_iterations,
         )
         response_text = extract_text_from_response(response)
         logger.info("Gemini response (%d chars): %s", len(response_text), response_text[:500])
@@ -212,7 +237,7 @@ def generate_insight(
     if not api_key:
         raise ValueError("No Gemini API key configured")
 
-    client = genai.Client(api_key=api_key)
+    client = _get_client(api_key)
 
     try:
         logger.debug(
@@ -330,7 +355,7 @@ def generate_nuggets(
 
     context = f"TREE STATISTICS:\n{stats_text}\n\nINTERESTING PATTERNS AND COINCIDENCES:\n{clusters_text}"
 
-    client = genai.Client(api_key=api_key)
+    client = _get_client(api_key)
 
     try:
         logger.info("Sending single-shot nugget generation request to Gemini...")
@@ -509,25 +534,25 @@ def generate_blog_post(
     logger.info("Gathered details for %d people from selected findings", len(person_details))
 
     # Step 4: Build the context — selected findings drive the topic
-    diversity_text = ""
+    context_parts = [
+        f"TREE STATISTICS (for background):\n{stats_text}\n\n"
+        f"SELECTED FINDINGS TO WRITE ABOUT:\n{selected_text}\n\n"
+        f"DETAILED PERSON RECORDS (for people mentioned in findings):\n",
+        "\n\n".join(person_details),
+    ]
     if previous_titles:
-        diversity_text += (
+        context_parts.append(
             "\n\nPREVIOUS BLOG POST TITLES (write about something DIFFERENT):\n"
-            + "\n".join(f"- {t}" for t in previous_titles[-15:])
         )
-
-    context = (
-        f"TREE STATISTICS (for background):\n{stats_text}\n\n"
-        f"SELECTED FINDINGS TO WRITE ABOUT:\n{selected_text}\n\n"
-        f"DETAILED PERSON RECORDS (for people mentioned in findings):\n"
-        + "\n\n".join(person_details)
-        + diversity_text
-        + "\n\nWrite a blog post based on the SELECTED FINDINGS above. "
+        context_parts.append("\n".join(f"- {t}" for t in previous_titles[-15:]))
+    context_parts.append(
+        "\n\nWrite a blog post based on the SELECTED FINDINGS above. "
         "The findings may be about events, patterns, or phenomena — not just people. "
         "Weave in the person details and historical context to bring the story to life."
     )
+    context = "".join(context_parts)
 
-    client = genai.Client(api_key=api_key)
+    client = _get_client(api_key)
 
     try:
         logger.info("Sending blog generation request to Gemini (with Google Search)...")
@@ -645,7 +670,7 @@ def generate_this_day(
     )
 
     from ..util import get_db_outside_request
-    from gramps.gen.lib.date import gregorian
+    from gramps.gen.lib.date import Date, gregorian
 
     db_handle = None
     try:
@@ -659,38 +684,36 @@ def generate_this_day(
         logger.info("Gathering events for month=%d, day=%d", month, day)
 
         # Pre-build reverse index: event_handle -> [(name, gramps_id), ...]
-        event_to_people = {}
-        for ph in db_handle.iter_person_handles():
-            p = db_handle.get_person_from_handle(ph)
+        # person_info caches (name, gramps_id) of every visible person so the
+        # family pass below needs no further person lookups.
+        person_info = {}
+        event_to_people = defaultdict(list)
+        for p in db_handle.iter_people():
             if not include_private and p.private:
                 continue
+            info = (p.get_primary_name().get_name(), p.get_gramps_id())
+            person_info[p.handle] = info
             for eref in p.get_event_ref_list():
-                event_to_people.setdefault(eref.ref, []).append(
-                    (p.get_primary_name().get_name(), p.get_gramps_id())
-                )
+                event_to_people[eref.ref].append(info)
 
-        event_to_family_people = {}
-        for fh in db_handle.iter_family_handles():
-            fam = db_handle.get_family_from_handle(fh)
+        event_to_family_people = defaultdict(list)
+        for fam in db_handle.iter_families():
             if not include_private and fam.private:
                 continue
+            people = [
+                person_info[spouse_handle]
+                for spouse_handle in (fam.get_father_handle(), fam.get_mother_handle())
+                if spouse_handle in person_info
+            ]
+            if not people:
+                continue
             for eref in fam.get_event_ref_list():
-                people = []
-                for spouse_handle in [fam.get_father_handle(), fam.get_mother_handle()]:
-                    if spouse_handle:
-                        spouse = db_handle.get_person_from_handle(spouse_handle)
-                        if include_private or not spouse.private:
-                            people.append(
-                                (spouse.get_primary_name().get_name(), spouse.get_gramps_id())
-                            )
-                if people:
-                    event_to_family_people.setdefault(eref.ref, []).extend(people)
+                event_to_family_people[eref.ref].extend(people)
 
         # Collect all events matching this month/day
         matching_events = []
 
-        for event_handle in db_handle.iter_event_handles():
-            event = db_handle.get_event_from_handle(event_handle)
+        for event in db_handle.iter_events():
             if not include_private and event.private:
                 continue
 
@@ -698,22 +721,24 @@ def generate_this_day(
             if not date or not date.is_valid():
                 continue
 
-            # Convert to gregorian calendar and check if month and day match
-            greg_date = gregorian(date)
-            if greg_date.get_month() == month and greg_date.get_day() == day:
+            # Convert to gregorian calendar (only if needed) and check if
+            # month and day match
+            if date.get_calendar() != Date.CAL_GREGORIAN:
+                date = gregorian(date)
+            if date.get_month() == month and date.get_day() == day:
                 event_type = event.get_type().string
-                year = greg_date.get_year()
+                year = date.get_year()
 
                 # Find people associated with this event
                 person_names = []
                 person_ids = []
 
                 # Look up people for this event from pre-built indexes
-                for name, gid in event_to_people.get(event_handle, []):
+                for name, gid in event_to_people.get(event.handle, []):
                     person_names.append(name)
                     person_ids.append(gid)
 
-                for name, gid in event_to_family_people.get(event_handle, []):
+                for name, gid in event_to_family_people.get(event.handle, []):
                     person_names.append(name)
                     person_ids.append(gid)
 
@@ -737,6 +762,10 @@ def generate_this_day(
         # Sort by year
         matching_events.sort(key=lambda x: x['year'])
 
+        # Release the database before the (slow) Gemini round-trip
+        db_handle.close()
+        db_handle = None
+
         # Build context for Gemini
         context_parts = [f"Events that happened on {month:02d}-{day:02d} across different years:\n"]
 
@@ -749,7 +778,7 @@ def generate_this_day(
         context = "\n".join(context_parts)
         logger.info("Context for Gemini (%d chars): %s", len(context), context[:300])
 
-        client = genai.Client(api_key=api_key)
+        client = _get_client(api_key)
 
         response = client.models.generate_content(
             model=model_name,
@@ -22,12 +22,20 @@
 from __future__ import annotations
 
 import os
-from typing import Any
-
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Any, Callable
+
+import orjson
+from flask import current_app, has_app_context
 from google import genai
 from google.genai import types
 from google.genai.types import GoogleSearch, Tool
 
+from ..util import get_logger
 from .deps import AgentDeps
 from .tools import (
     add_event_to_person,
@@ -49,603 +57,636 @@ from .tools import (
 )
 
 
-SYSTEM_PROMPT = """You are a witty, curious family history assistant who genuinely enjoys digging through genealogy records. Think of yourself as the friend who falls down Wikipedia rabbit holes and comes back with amazing stories.
-
-YOUR VOICE:
-- Conversational and engaging, never dry or clinical
-- Let humor come naturally — a wry aside, an unexpected comparison, a funny observation
-- Lead with what's surprising or weird, not with a data dump
-- When the data is dramatic, lean into it. When it's mundane, find the angle that makes it fun.
-- Don't be sentimental by default. Save the heartstrings for when they're earned.
-- Make every response feel like something worth reading, not just an answer.
-
-IMPORTANT GUIDELINES
-
-Use the available tools to retrieve information from the user's genealogy database.
-
-Base your answers ONLY on information returned by the tools. Do NOT make up facts, dates, names, relationships, or any other details.
-
-Think carefully about what the user is asking before choosing which tool and parameters to use.
-
-If the user refers to themselves ("I", "my", "me"), ask for their name in the family tree to look them up.
-
-IMPORTANT: When looking up a specific person by name, ALWAYS use filter_people with given_name and/or surname parameters. Do NOT use search_genealogy_database for name lookups - that tool is for semantic/concept searches only. Use filter_people for precise name matching.
-
+SYSTEM_PROMPT = """You are a witty, curious family history assistant who enjoys digging through genealogy records, like a friend who falls down Wikipedia rabbit holes and comes back with amazing stories.
 
-ANALYTICAL DEPTH AND NARRATIVE SYNTHESIS
+VOICE
+Be conversational, never dry or clinical. Let humor come naturally. Lead with what's surprising, not with a data dump. Lean into dramatic material; find the fun angle in mundane material. Don't be sentimental by default.
 
-Your most valuable role is to notice things the user would never think to ask about. Most users don't know what's in their tree, so they can't form good questions.
+GROUNDING
+Use the tools to retrieve information from the user's genealogy database. Base your answers ONLY on what the tools return; never make up facts, dates, names, or relationships. Think about what the user is asking before choosing tools and parameters. If the user refers to themselves ("I", "my", "me"), ask for their name in the family tree.
 
-When asked broad questions like "what's interesting?" or "surprise me", use find_coincidences_and_clusters to discover patterns: geographic clusters, temporal clusters, chain migration, naming traditions, parallel lives.
+To look up a person by name, ALWAYS use filter_people with given_name and/or surname. search_genealogy_database is for semantic/concept searches only.
 
-The bar for "interesting" is high. Don't just report statistical extremes ("oldest person was 94"). Look for coincidences that suggest a story: "Three sisters all married men from the same Norwegian parish within two years" or "This person listed as 'drayman' in 1895 but 'automobile mechanic' in 1912 - one of the first to make the transition."
+ANALYSIS
+Your most valuable role is noticing things the user would never think to ask about. The bar for "interesting" is high: not statistical extremes ("oldest person was 94"), but coincidences that suggest a story ("three sisters married men from the same Norwegian parish within two years", "a drayman in 1895 who was an automobile mechanic by 1912").
 
-Use multi-step reasoning: discover a pattern → get full details on the people involved → search the web for historical context → weave it into a narrative.
+Chain tools: discover a pattern, get full details on the people involved, search the web for historical context, then weave it into a narrative.
+- Discovery ("what's interesting", "surprise me"): find_coincidences_and_clusters, then get_person_full_details and web search on the best findings.
+- A specific person ("tell me about X"): get_person_full_details, related people via filter_people or search_genealogy_database, historical context for known dates/places. Write a narrative, not a list of facts.
+- Migration: analyze_migration_patterns, then proactively search for why people moved (wars, famines, land grants, gold rushes, immigration laws, economic booms, religious persecution).
+- Relationship between two people: find_relationship_path.
+- Data quality: note missing sources or inconsistent data; find_data_quality_issues can help.
 
-For migration questions, use analyze_migration_patterns to find movement patterns, then proactively search for historical events that explain WHY people moved: wars, famines, land grants, gold rushes, religious persecution, economic booms.
+RELATIVES
+To find parents, grandparents, siblings, cousins, etc.: first get the person's Gramps ID, then use filter_people with a relationship filter AND show_relation_with set to that ID, so results carry labels like [father] or [sibling]. Filters: ancestor_of (parents=1, grandparents=2), descendant_of (children=1, grandchildren=2), degrees_of_separation_from (siblings=2, uncles=3, cousins=4), has_common_ancestor_with.
 
+WEB RESEARCH
+Use Google Search for historical context, living conditions, occupations, immigration, and "what was life like" questions, and combine it with database facts. Cite web sources as links in a "Sources:" section at the end.
 
-TOOL CHAINING STRATEGY
+FORMATTING (CRITICAL)
+Copy links like [Name](/person/I0044) from tool results EXACTLY; never change or strip the path. Write plain sentences with Markdown links only: no numbered lists, bullet points, bold, italic, headers, code blocks, or blockquotes. Separate multiple items with "and" or line breaks.
 
-For narrative questions about specific people: use get_person_full_details to get comprehensive details, then search_genealogy_database or filter_people to find related people, then Google Search for historical context.
+If the tools don't give you enough information, say "I don't know" or "I couldn't find that information." Be concise and accurate, but a good story is worth a few extra sentences."""
 
-For "tell me about [person]" requests: pull all available data and weave it into a readable narrative, not just a list of facts. Include historical context when dates/places are known.
 
-For discovery questions ("what's interesting", "surprise me"): start with find_coincidences_and_clusters, pick the most compelling findings, then enrich them with get_person_full_details and web search.
+class _ToolContext:
+    """Minimal context object that mimics RunContext[AgentDeps] for tool calls.
 
-For relationship questions: use find_relationship_path to explain the connection in plain language.
+    The existing tools in tools.py expect ctx.deps to hold an AgentDeps instance.
+    This wrapper provides that interface without depending on pydantic_ai.
+    """
 
-For data quality awareness: when presenting information, note when sources are missing or data seems inconsistent. The find_data_quality_issues tool can help identify gaps.
+    __slots__ = ("deps",)
 
+    def __init__(self, deps: AgentDeps):
+        self.deps = deps
 
-WEB RESEARCH GUIDELINES
 
-When the user asks about historical context, living conditions, occupations, immigration patterns, or "what was life like" questions, use Google Search to find relevant historical information.
+@lru_cache(maxsize=None)
+def _string(description: str) -> types.Schema:
+    """Return a shared string parameter schema."""
+    return types.Schema(type=types.Type.STRING, description=description)
 
-Always combine database facts with historical context when both are relevant.
 
-When you find migration patterns in the tree (people moving from one place to another), proactively search for historical events that might explain why: wars, famines, economic booms, immigration laws, land grants, gold rushes, religious persecution, etc. This is one of the most valuable things you can do.
+@lru_cache(maxsize=None)
+def _integer(description: str) -> types.Schema:
+    """Return a shared integer parameter schema."""
+    return types.Schema(type=types.Type.INTEGER, description=description)
 
-When citing web sources, include them as links at the end of your response in a "Sources:" section.
 
+@lru_cache(maxsize=None)
+def _boolean(description: str) -> types.Schema:
+    """Return a shared boolean parameter schema."""
+    return types.Schema(type=types.Type.BOOLEAN, description=description)
 
-RELATIONSHIP QUERIES
 
-For questions about relationships like parents, grandparents, siblings, or cousins, follow this workflow:
+# Shared schema for the max_results parameter of all tools. Each tool applies
+# its own default and clamps the value to its own limit.
+_MAX_RESULTS_SCHEMA = _integer("Maximum results to return (capped by the tool)")
 
-First, search for the person to get their Gramps ID.
 
-Then use filter_people with the relationship filter AND show_relation_with set to that Gramps ID.
+# Gemini function declarations for the tools. They are static metadata
+# (independent of the request), so they are built once at import time.
+_TOOL_DECLARATIONS: list[types.FunctionDeclaration] = [
+    types.FunctionDeclaration(
+        name="get_current_date",
+        description="Returns today's date in ISO format (YYYY-MM-DD).",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={},
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="search_genealogy_database",
+        description=(
+            "Searches the user's family tree using semantic similarity. "
+            "Returns formatted genealogical data including people, families, "
+            "events, places, sources, citations, repositories, notes, and "
+            "media matching the query."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "query": _string("Search query for genealogical information"),
+                "max_results": _MAX_RESULTS_SCHEMA,
+            },
+            required=["query"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="filter_people",
+        description=(
+            "Filters people in the family tree based on criteria. "
+            "Examples: parents: ancestor_of='I0044', ancestor_generations=1, "
+            "show_relation_with='I0044'. Siblings: degrees_of_separation_from='I0044', "
+            "degrees_of_separation=2, show_relation_with='I0044'."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "given_name": _string("Given/first name to search for (partial match)"),
+                "surname": _string("Surname/last name to search for (partial match)"),
+                "birth_year_before": _string(
+                    "Year before which people were born (e.g., '1900')"
+                ),
+                "birth_year_after": _string(
+                    "Year after which people were born (e.g., '1850')"
+                ),
+                "birth_place": _string(
+                    "Place name where person was born (partial match)"
+                ),
+                "death_year_before": _string(
+                    "Year before which people died (e.g., '1950')"
+                ),
+                "death_year_after": _string(
+                    "Year after which people died (e.g., '1800')"
+                ),
+                "death_place": _string("Place name where person died (partial match)"),
+                "ancestor_of": _string(
+                    "Gramps ID of person to find ancestors of (e.g., 'I0044')"
+                ),
+                "ancestor_generations": _integer(
+                    "Maximum generations to search for ancestors (default: 10)"
+                ),
+                "descendant_of": _string(
+                    "Gramps ID of person to find descendants of (e.g., 'I0044')"
+                ),
+                "descendant_generations": _integer(
+                    "Maximum generations to search for descendants (default: 10)"
+                ),
+                "is_male": _boolean("Filter to only males"),
+                "is_female": _boolean("Filter to only females"),
+                "probably_alive_on_date": _string(
+                    "Date to check if person was likely alive (YYYY-MM-DD)"
+                ),
+                "has_common_ancestor_with": _string(
+                    "Gramps ID to find people sharing an ancestor"
+                ),
+                "degrees_of_separation_from": _string(
+                    "Gramps ID of person to find relatives connected to. "
+                    "Each parent-child or spousal connection counts as 1. "
+                    "Examples: sibling=2, grandparent=2, uncle=3, first cousin=4"
+                ),
+                "degrees_of_separation": _integer(
+                    "Maximum relationship path length (default: 2)"
+                ),
+                "combine_filters": _string(
+                    "How to combine multiple filters: 'and' (default) or 'or'"
+                ),
+                "max_results": _MAX_RESULTS_SCHEMA,
+                "show_relation_with": _string(
+                    "Gramps ID of person to show relationships relative to. ALWAYS set "
+                    "this with relationship filters to get labels like [father], [sibling]."
+                ),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="filter_events",
+        description=(
+            "Filter events in the genealogy database. Events are occurrences in "
+            "people's lives (births, deaths, marriages, etc.) or general historical events."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "event_type": _string(
+                    "Type of event (e.g., 'Birth', 'Death', 'Marriage', "
+                    "'Baptism', 'Census', 'Emigration', 'Burial', 'Occupation', 'Residence')"
+                ),
+                "date_before": _string(
+                    "Latest year to include (e.g., '1900'). Use only the year."
+                ),
+                "date_after": _string(
+                    "Earliest year to include (e.g., '1850'). Use only the year."
+                ),
+                "place": _string(
+                    "Location name to search for (e.g., 'Boston', 'Massachusetts')"
+                ),
+                "description_contains": _string(
+                    "Text that should appear in the event description"
+                ),
+                "participant_id": _string(
+                    "Gramps ID of a person who participated in the event (e.g., 'I0001')"
+                ),
+                "participant_role": _string(
+                    "Role of the participant (e.g., 'Primary', 'Family')"
+                ),
+                "max_results": _MAX_RESULTS_SCHEMA,
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_data_quality_issues",
+        description=(
+            "Get data quality issue counts or affected records. Use issue_type='all' "
+            "for summary counts, or a specific issue type for records."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "issue_type": _string(
+                    "Issue type to query: 'all', 'unknown_gender', "
+                    "'missing_birth', 'missing_death', 'missing_parents', "
+                    "'disconnected', 'incomplete_names', 'incomplete_events', "
+                    "'no_marriage_records', 'no_sources'"
+                ),
+                "max_results": _MAX_RESULTS_SCHEMA,
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="update_person_field",
+        description=(
+            "Update a supported person field. Currently supports gender "
+            "(0=female, 1=male, 2=unknown)."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "gramps_id": _string(
+                    "Gramps ID of the person to update (e.g., 'I0001')"
+                ),
+                "field": _string("Field to update. Currently: 'gender'"),
+                "value": _integer("New field value (for gender: 0, 1, or 2)"),
+                "reason": _string("Optional rationale stored in revision message"),
+            },
+            required=["gramps_id", "field", "value"],
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="add_event_to_person",
+        description=(
+            "Create and link a birth/death event for a person with duplicate prevention."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "gramps_id": _string("Gramps ID of the person (e.g., 'I0044')"),
+                "event_type": _string("Event type to add: 'Birth' or 'Death'"),
+                "year": _integer("Event year (positive integer)"),
+                "month": _integer("Event month (0-12, optional)"),
+                "day": _integer("Event day (0-31, optional)"),
+                "place_name": _string("Optional free-text place name"),
+                "reason": _string("Optional rationale stored in revision message"),
+            },
+            required=["gramps_id", "event_type", "year"],
+        ),
+    ),
+    # Phase 6 - Tier 1: Deep Record Access
+    types.FunctionDeclaration(
+        name="get_person_full_details",
+        description=(
+            "Get complete record for one person including all events, notes, sources, "
+            "media refs, family links, and attributes. Use this when you need comprehensive "
+            "details about a specific person beyond basic biographical info."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "gramps_id": _string("Gramps ID of the person (e.g., 'I0001')"),
+                "handle": _string(
+                    "Internal handle of the person (use gramps_id instead if you have it)"
+                ),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_family_details",
+        description=(
+            "Get full family record including parents, children, marriage/divorce events, "
+            "and family notes."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "family_handle": _string("Internal handle of the family"),
+                "gramps_id": _string(
+                    "Gramps ID of either spouse (will find their family)"
+                ),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="find_relationship_path",
+        description=(
+            "Calculate exact relationship between two people and return the connecting path. "
+            "Example: 'A is the grandfather of B' with distance information."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "person1_id": _string("Gramps ID of first person"),
+                "person2_id": _string("Gramps ID of second person"),
+            },
+            required=["person1_id", "person2_id"],
+        ),
+    ),
+    # Phase 6 - Tier 2: Whole-Tree Analytics
+    types.FunctionDeclaration(
+        name="get_tree_statistics",
+        description=(
+            "Get aggregate statistics about the entire family tree including total counts, "
+            "date ranges, top surnames, top places, average family size, average lifespan, "
+            "geographic distribution, and event type distribution."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={},
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="find_coincidences_and_clusters",
+        description=(
+            "The most important analytical tool. Find narratively interesting patterns and "
+            "coincidences in the family tree. Looks for geographic clusters, temporal clusters, "
+            "chain migration, name reuse (necronyms), occupation shifts, parallel lives, "
+            "disappearances, and statistical outliers. Use this for 'surprise me' or "
+            "'what's interesting' queries. max_results applies per category."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "category": _string(
+                    "Type of coincidence to search for: 'all' (default), "
+                    "'geographic_clusters', 'temporal_clusters', 'chain_migration', "
+                    "'name_reuse', 'occupation_shifts', 'parallel_lives', "
+                    "'disappearances', 'statistical_outliers'"
+                ),
+                "max_results": _MAX_RESULTS_SCHEMA,
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="analyze_migration_patterns",
+        description=(
+            "Extract all location changes across people and generations. Returns a timeline "
+            "of geographic movements grouped by family line. Highlights chain migration when "
+            "multiple families moved to/from the same place in the same period."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "surname": _string("Filter to one family line (optional)"),
+                "start_year": _integer("Earliest year to include (optional)"),
+                "end_year": _integer("Latest year to include (optional)"),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="find_data_quality_issues",
+        description=(
+            "Find people missing key data or with suspicious records. Useful for identifying "
+            "gaps in the family tree."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "issue_type": _string(
+                    "Type of data quality issue: 'missing_birth', 'missing_death', "
+                    "'missing_parents', 'no_sources', 'no_death_for_old', "
+                    "'impossible_dates', 'potential_duplicates'"
+                ),
+                "max_results": _MAX_RESULTS_SCHEMA,
+            },
+            required=["issue_type"],
+        ),
+    ),
+    # Phase 6 - Tier 3: Cultural Patterns
+    types.FunctionDeclaration(
+        name="analyze_naming_patterns",
+        description=(
+            "Find naming traditions: children named after grandparents, recurring given names "
+            "across generations, necronyms (reusing names of deceased children)."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "surname": _string("Filter to one family line (optional)"),
+                "max_generations": _integer(
+                    "How many generations to analyze (default: 5)"
+                ),
+            },
+        ),
+    ),
+    types.FunctionDeclaration(
+        name="get_occupation_summary",
+        description=(
+            "List all occupations found in events/attributes, grouped by time period and "
+            "location. Highlights occupation transitions within same person's life "
+            "(e.g., farmer → factory worker) and occupation clusters (many people in same "
+            "trade in same place)."
+        ),
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "surname": _string("Filter to one family line (optional)"),
+                "start_year": _integer("Earliest year to include (optional)"),
+                "end_year": _integer("Latest year to include (optional)"),
+            },
+        ),
+    ),
+]
 
-Results will have labels like [father], [grandfather], [sibling] that help you identify the correct people.
 
-Available relationship filters: ancestor_of (parents=1, grandparents=2), descendant_of (children=1, grandchildren=2), degrees_of_separation_from (siblings=2, uncles=3, cousins=4), has_common_ancestor_with
+# The tool sets sent with agent requests: the function declarations above,
+# with or without Google Search grounding.
+_AGENT_TOOLS: list[types.Tool] = [
+    types.Tool(
+        function_declarations=_TOOL_DECLARATIONS,
+        google_search=GoogleSearch(),
+    ),
+]
+_AGENT_TOOLS_NO_SEARCH: list[types.Tool] = [
+    types.Tool(function_declarations=_TOOL_DECLARATIONS),
+]
 
-Without show_relation_with, you cannot distinguish between generations or relationship types.
 
+def _get_agent_tools(google_search: bool) -> list[types.Tool]:
+    """Return the agent's tool set, with or without Google Search."""
+    return _AGENT_TOOLS if google_search else _AGENT_TOOLS_NO_SEARCH
 
-FORMATTING RULES (CRITICAL)
 
-Tool results contain links like [Name](/person/I0044). Copy these EXACTLY as they appear. Never modify the URLs. Do NOT strip links, always keep links if possible.
+# Tools that modify the tree. Turns that call them are executed sequentially.
+_WRITE_TOOLS = frozenset({"update_person_field", "add_event_to_person"})
 
-Never change /person/I0044 to # or remove it. Keep the exact path.
+# Maximum number of tool calls running on worker threads in this process.
+# Calls that timed out keep running (Python threads can't be cancelled) and
+# occupy their worker until they finish, so hung tools can't pile up threads.
+# Further calls wait for a free worker.
+_MAX_RUNNING_TOOL_CALLS = 16
 
-ABSOLUTELY FORBIDDEN: Do not use numbered lists (1. 2. 3.), bullet points (- or *), bold (**text**), italic (*text*), headers (#), code blocks (```), or blockquotes (>).
+# Time in seconds a turn waits for its read-only tool calls, including the
+# time spent waiting for a free worker.
+_TOOL_CALL_TIMEOUT = 30
 
-If you use ANY of these forbidden formats, you are making a mistake.
+# Shared by all requests; worker threads are only started on first use.
+_TOOL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=_MAX_RUNNING_TOOL_CALLS, thread_name_prefix="llm-tool"
+)
 
-To list multiple items, separate them with "and" or line breaks. Never use numbers or bullets.
+# Number of most recent tool result turns that are always sent in full, and
+# the length above which older tool results are elided.
+_KEEP_TOOL_RESULT_TURNS = 3
+_ELIDE_TOOL_RESULT_LENGTH = 2000
+
+# Prompt asking the model for its final answer when the tool loop is cut off.
+_FORCED_SYNTHESIS_CONTENT = types.Content(
+    role="user",
+    parts=[
+        types.Part.from_text(
+            text="Please provide your answer now based on the information you've gathered. Synthesize what you've learned into a helpful response."
+        )
+    ],
+)
 
-Keep it simple: plain sentences with Markdown links only.
+# If the same set of tool calls is requested this many times within the last
+# few turns, the agent is going in circles and is asked for its answer.
+_MAX_REPEATED_TOOL_TURNS = 3
 
 
-OTHER GUIDELINES
+# Explicit Gemini context caches for the stable request prefix (system
+# prompt + tool declarations), keyed by (client, model, system prompt, Google
+# Search enabled), since caches belong to the API key they were created with.
+# Values are (cache name or None if creation failed, monotonic time until
+# reuse).
+_ContextCacheKey = tuple[genai.Client, str, str, bool]
+_CONTEXT_CACHES: dict[_ContextCacheKey, tuple[str | None, float]] = {}
+# One lock per key, so that a cache is created only once at a time without
+# blocking requests that use another cache. The global lock only guards the
+# two dictionaries and is never held during network calls.
+_CONTEXT_CACHE_KEY_LOCKS: dict[_ContextCacheKey, threading.Lock] = {}
+_CONTEXT_CACHES_LOCK = threading.Lock()
 
-If you don't have enough information after using the tools, say "I don't know" or "I couldn't find that information."
 
-Keep your answers concise and accurate, but don't sacrifice narrative quality for brevity. A good story is worth a few extra sentences."""
+def _get_context_cache_name(
+    client: genai.Client,
+    model_name: str,
+    system_prompt: str,
+    google_search: bool,
+    ttl: int,
+) -> str | None:
+    """Return the name of a Gemini context cache holding the stable prefix.
+
+    The cache is created on first use and recreated shortly before its TTL
+    expires. Returns None if no cache is available (e.g. because the prefix is
+    below the model's minimum cacheable size); failures are remembered for
+    the TTL so they are not retried on every request.
+    """
+    key = (client, model_name, system_prompt, google_search)
+    with _CONTEXT_CACHES_LOCK:
+        entry = _CONTEXT_CACHES.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        key_lock = _CONTEXT_CACHE_KEY_LOCKS.setdefault(key, threading.Lock())
+    with key_lock:
+        # another request may have created the cache while we were waiting
+        with _CONTEXT_CACHES_LOCK:
+            entry = _CONTEXT_CACHES.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        try:
+            cache = client.caches.create(
+                model=model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt,
+                    tools=_get_agent_tools(google_search),
+                    ttl=f"{ttl}s",
+                ),
+            )
+            name = cache.name
+        except Exception as e:  # pylint: disable=broad-except
+            get_logger().warning("Could not create Gemini context cache: %s", e)
+            name = None
+        with _CONTEXT_CACHES_LOCK:
+            # refresh before the server-side TTL runs out
+            _CONTEXT_CACHES[key] = (name, now + 0.9 * ttl)
+        return name
+
+
+@lru_cache(maxsize=4)
+def _get_client(api_key: str) -> genai.Client:
+    """Return a Gemini client for the API key.
+
+    Clients are shared between requests (and threads) so that their HTTP
+    connections are kept alive and reused.
+    """
+    return genai.Client(api_key=api_key)
 
 
-class _ToolContext:
-    """Minimal context object that mimics RunContext[AgentDeps] for tool calls.
+@lru_cache(maxsize=4)
+def _get_service_tier(service_tier: str | None) -> str | None:
+    """Return the service tier if the installed google-genai accepts it.
 
-    The existing tools in tools.py expect ctx.deps to hold an AgentDeps instance.
-    This wrapper provides that interface without depending on pydantic_ai.
+    Older google-genai versions have no service tier field. There, the
+    setting is logged once and then ignored, instead of failing every chat
+    request.
     """
-
-    def __init__(self, deps: AgentDeps):
-        self.deps = deps
+    if not service_tier:
+        return None
+    try:
+        types.GenerateContentConfig(service_tier=service_tier)
+    except ValueError as e:
+        get_logger().error(
+            "Ignoring LLM_SERVICE_TIER %r, which the installed google-genai "
+            "version does not support: %s",
+            service_tier,
+            e,
+        )
+        return None
+    return service_tier
+
+
+@lru_cache(maxsize=16)
+def _get_generate_config(
+    system_prompt: str,
+    cached_content: str | None,
+    google_search: bool = True,
+    final: bool = False,
+    service_tier: str | None = None,
+) -> types.GenerateContentConfig:
+    """Return the agent's generation config.
+
+    The config only depends on the system prompt, the context cache in use,
+    whether Google Search is enabled, whether it is for the final forced
+    answer and the service tier, so it is built once per combination and
+    shared between requests. For the final answer, function calling is
+    disabled unless the tools come from a context cache, which does not allow
+    overriding the tool config.
+    """
+    # only pass the service tier if set, as older SDK versions lack the field
+    extra: dict[str, Any] = {"service_tier": service_tier} if service_tier else {}
+    if cached_content:
+        # system instruction and tools are part of the cached content
+        return types.GenerateContentConfig(
+            cached_content=cached_content,
+            temperature=0.2,
+            **extra,
+        )
+    tool_config = None
+    if final:
+        tool_config = types.ToolConfig(
+            function_calling_config=types.FunctionCallingConfig(
+                mode=types.FunctionCallingConfigMode.NONE
+            )
+        )
+    return types.GenerateContentConfig(
+        system_instruction=system_prompt,
+        tools=_get_agent_tools(google_search),
+        tool_config=tool_config,
+        temperature=0.2,
+        **extra,
+    )
 
 
-def _make_tool_wrappers(deps: AgentDeps) -> list[types.FunctionDeclaration]:
-    """Create Gemini function declarations that wrap the existing tools.
+# Tool functions by name. All entries take (ctx, **tool_args); tools without
+# parameters ignore any arguments the model passes.
+_TOOL_DISPATCH: dict[str, Callable[..., str]] = {
+    "get_current_date": lambda ctx, **_: get_current_date(ctx),
+    "search_genealogy_database": search_genealogy_database,
+    "filter_people": filter_people,
+    "filter_events": filter_events,
+    "get_data_quality_issues": get_data_quality_issues,
+    "update_person_field": update_person_field,
+    "add_event_to_person": add_event_to_person,
+    # Phase 6 - Tier 1: Deep Record Access
+    "get_person_full_details": get_person_full_details,
+    "get_family_details": get_family_details,
+    "find_relationship_path": find_relationship_path,
+    # Phase 6 - Tier 2: Whole-Tree Analytics
+    "get_tree_statistics": lambda ctx, **_: get_tree_statistics(ctx),
+    "find_coincidences_and_clusters": find_coincidences_and_clusters,
+    "analyze_migration_patterns": analyze_migration_patterns,
+    "find_data_quality_issues": find_data_quality_issues,
+    # Phase 6 - Tier 3: Cultural Patterns
+    "analyze_naming_patterns": analyze_naming_patterns,
+    "get_occupation_summary": get_occupation_summary,
+}
 
-    Returns a list of FunctionDeclaration objects for Gemini's function calling.
-    The actual tool execution is handled separately in execute_tool_call().
-    """
-    return [
-        types.FunctionDeclaration(
-            name="get_current_date",
-            description="Returns today's date in ISO format (YYYY-MM-DD).",
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={},
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="search_genealogy_database",
-            description=(
-                "Searches the user's family tree using semantic similarity. "
-                "Returns formatted genealogical data including people, families, "
-                "events, places, sources, citations, repositories, notes, and "
-                "media matching the query."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "query": types.Schema(
-                        type=types.Type.STRING,
-                        description="Search query for genealogical information",
-                    ),
-                    "max_results": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Maximum results to return (default: 20, max: 50)",
-                    ),
-                },
-                required=["query"],
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="filter_people",
-            description=(
-                "Filters people in the family tree based on criteria. "
-                "IMPORTANT: When filtering by relationships (ancestor_of, descendant_of, "
-                "degrees_of_separation_from), ALWAYS set show_relation_with to the same "
-                "Gramps ID to get relationship labels in results. "
-                "Examples: Find parents with labels: ancestor_of='I0044', ancestor_generations=1, "
-                "show_relation_with='I0044'. Find siblings: degrees_of_separation_from='I0044', "
-                "degrees_of_separation=2, show_relation_with='I0044'."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "given_name": types.Schema(
-                        type=types.Type.STRING,
-                        description="Given/first name to search for (partial match)",
-                    ),
-                    "surname": types.Schema(
-                        type=types.Type.STRING,
-                        description="Surname/last name to search for (partial match)",
-                    ),
-                    "birth_year_before": types.Schema(
-                        type=types.Type.STRING,
-                        description="Year before which people were born (e.g., '1900')",
-                    ),
-                    "birth_year_after": types.Schema(
-                        type=types.Type.STRING,
-                        description="Year after which people were born (e.g., '1850')",
-                    ),
-                    "birth_place": types.Schema(
-                        type=types.Type.STRING,
-                        description="Place name where person was born (partial match)",
-                    ),
-                    "death_year_before": types.Schema(
-                        type=types.Type.STRING,
-                        description="Year before which people died (e.g., '1950')",
-                    ),
-                    "death_year_after": types.Schema(
-                        type=types.Type.STRING,
-                        description="Year after which people died (e.g., '1800')",
-                    ),
-                    "death_place": types.Schema(
-                        type=types.Type.STRING,
-                        description="Place name where person died (partial match)",
-                    ),
-                    "ancestor_of": types.Schema(
-                        type=types.Type.STRING,
-                        description="Gramps ID of person to find ancestors of (e.g., 'I0044')",
-                    ),
-                    "ancestor_generations": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Maximum generations to search for ancestors (default: 10)",
-                    ),
-                    "descendant_of": types.Schema(
-                        type=types.Type.STRING,
-                        description="Gramps ID of person to find descendants of (e.g., 'I0044')",
-                    ),
-                    "descendant_generations": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Maximum generations to search for descendants (default: 10)",
-                    ),
-                    "is_male": types.Schema(
-                        type=types.Type.BOOLEAN,
-                        description="Filter to only males",
-                    ),
-                    "is_female": types.Schema(
-                        type=types.Type.BOOLEAN,
-                        description="Filter to only females",
-                    ),
-                    "probably_alive_on_date": types.Schema(
-                        type=types.Type.STRING,
-                        description="Date to check if person was likely alive (YYYY-MM-DD)",
-                    ),
-                    "has_common_ancestor_with": types.Schema(
-                        type=types.Type.STRING,
-                        description="Gramps ID to find people sharing an ancestor",
-                    ),
-                    "degrees_of_separation_from": types.Schema(
-                        type=types.Type.STRING,
-                        description=(
-                            "Gramps ID of person to find relatives connected to. "
-                            "Each parent-child or spousal connection counts as 1. "
-                            "Examples: sibling=2, grandparent=2, uncle=3, first cousin=4"
-                        ),
-                    ),
-                    "degrees_of_separation": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Maximum relationship path length (default: 2)",
-                    ),
-                    "combine_filters": types.Schema(
-                        type=types.Type.STRING,
-                        description="How to combine multiple filters: 'and' (default) or 'or'",
-                    ),
-                    "max_results": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Maximum results to return (default: 50, max: 100)",
-                    ),
-                    "show_relation_with": types.Schema(
-                        type=types.Type.STRING,
-                        description=(
-                            "Gramps ID of person to show relationships relative to. "
-                            "ALWAYS use this with relationship filters to get labels like [father], [sibling]."
-                        ),
-                    ),
-                },
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="filter_events",
-            description=(
-                "Filter events in the genealogy database. Events are occurrences in "
-                "people's lives (births, deaths, marriages, etc.) or general historical events."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "event_type": types.Schema(
-                        type=types.Type.STRING,
-                        description=(
-                            "Type of event (e.g., 'Birth', 'Death', 'Marriage', "
-                            "'Baptism', 'Census', 'Emigration', 'Burial', 'Occupation', 'Residence')"
-                        ),
-                    ),
-                    "date_before": types.Schema(
-                        type=types.Type.STRING,
-                        description="Latest year to include (e.g., '1900'). Use only the year.",
-                    ),
-                    "date_after": types.Schema(
-                        type=types.Type.STRING,
-                        description="Earliest year to include (e.g., '1850'). Use only the year.",
-                    ),
-                    "place": types.Schema(
-                        type=types.Type.STRING,
-                        description="Location name to search for (e.g., 'Boston', 'Massachusetts')",
-                    ),
-                    "description_contains": types.Schema(
-                        type=types.Type.STRING,
-                        description="Text that should appear in the event description",
-                    ),
-                    "participant_id": types.Schema(
-                        type=types.Type.STRING,
-                        description="Gramps ID of a person who participated in the event (e.g., 'I0001')",
-                    ),
-                    "participant_role": types.Schema(
-                        type=types.Type.STRING,
-                        description="Role of the participant (e.g., 'Primary', 'Family')",
-                    ),
-                    "max_results": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Maximum number of results to return (1-100, default 50)",
-                    ),
-                },
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="get_data_quality_issues",
-            description=(
-                "Get data quality issue counts or affected records. Use issue_type='all' "
-                "for summary counts, or a specific issue type for records."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "issue_type": types.Schema(
-                        type=types.Type.STRING,
-                        description=(
-                            "Issue type to query: 'all', 'unknown_gender', "
-                            "'missing_birth', 'missing_death', 'missing_parents', "
-                            "'disconnected', 'incomplete_names', 'incomplete_events', "
-                            "'no_marriage_records', 'no_sources'"
-                        ),
-                    ),
-                    "max_results": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Maximum records to return for specific issue types (1-50, default 20)",
-                    ),
-                },
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="update_person_field",
-            description=(
-                "Update a supported person field. Currently supports gender "
-                "(0=female, 1=male, 2=unknown)."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "gramps_id": types.Schema(
-                        type=types.Type.STRING,
-                        description="Gramps ID of the person to update (e.g., 'I0001')",
-                    ),
-                    "field": types.Schema(
-                        type=types.Type.STRING,
-                        description="Field to update. Currently: 'gender'",
-                    ),
-                    "value": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="New field value (for gender: 0, 1, or 2)",
-                    ),
-                    "reason": types.Schema(
-                        type=types.Type.STRING,
-                        description="Optional rationale stored in revision message",
-                    ),
-                },
-                required=["gramps_id", "field", "value"],
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="add_event_to_person",
-            description=(
-                "Create and link a birth/death event for a person with duplicate prevention."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "gramps_id": types.Schema(
-                        type=types.Type.STRING,
-                        description="Gramps ID of the person (e.g., 'I0044')",
-                    ),
-                    "event_type": types.Schema(
-                        type=types.Type.STRING,
-                        description="Event type to add: 'Birth' or 'Death'",
-                    ),
-                    "year": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Event year (positive integer)",
-                    ),
-                    "month": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Event month (0-12, optional)",
-                    ),
-                    "day": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Event day (0-31, optional)",
-                    ),
-                    "place_name": types.Schema(
-                        type=types.Type.STRING,
-                        description="Optional free-text place name",
-                    ),
-                    "reason": types.Schema(
-                        type=types.Type.STRING,
-                        description="Optional rationale stored in revision message",
-                    ),
-                },
-                required=["gramps_id", "event_type", "year"],
-            ),
-        ),
-        # Phase 6 - Tier 1: Deep Record Access
-        types.FunctionDeclaration(
-            name="get_person_full_details",
-            description=(
-                "Get complete record for one person including all events, notes, sources, "
-                "media refs, family links, and attributes. Use this when you need comprehensive "
-                "details about a specific person beyond basic biographical info."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "gramps_id": types.Schema(
-                        type=types.Type.STRING,
-                        description="Gramps ID of the person (e.g., 'I0001')",
-                    ),
-                    "handle": types.Schema(
-                        type=types.Type.STRING,
-                        description="Internal handle of the person (use gramps_id instead if you have it)",
-                    ),
-                },
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="get_family_details",
-            description=(
-                "Get full family record including parents, children, marriage/divorce events, "
-                "and family notes."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "family_handle": types.Schema(
-                        type=types.Type.STRING,
-                        description="Internal handle of the family",
-                    ),
-                    "gramps_id": types.Schema(
-                        type=types.Type.STRING,
-                        description="Gramps ID of either spouse (will find their family)",
-                    ),
-                },
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="find_relationship_path",
-            description=(
-                "Calculate exact relationship between two people and return the connecting path. "
-                "Example: 'A is the grandfather of B' with distance information."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "person1_id": types.Schema(
-                        type=types.Type.STRING,
-                        description="Gramps ID of first person",
-                    ),
-                    "person2_id": types.Schema(
-                        type=types.Type.STRING,
-                        description="Gramps ID of second person",
-                    ),
-                },
-                required=["person1_id", "person2_id"],
-            ),
-        ),
-        # Phase 6 - Tier 2: Whole-Tree Analytics
-        types.FunctionDeclaration(
-            name="get_tree_statistics",
-            description=(
-                "Get aggregate statistics about the entire family tree including total counts, "
-                "date ranges, top surnames, top places, average family size, average lifespan, "
-                "geographic distribution, and event type distribution."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={},
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="find_coincidences_and_clusters",
-            description=(
-                "The most important analytical tool. Find narratively interesting patterns and "
-                "coincidences in the family tree. Looks for geographic clusters, temporal clusters, "
-                "chain migration, name reuse (necronyms), occupation shifts, parallel lives, "
-                "disappearances, and statistical outliers. Use this for 'surprise me' or "
-                "'what's interesting' queries."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "category": types.Schema(
-                        type=types.Type.STRING,
-                        description=(
-                            "Type of coincidence to search for: 'all' (default), "
-                            "'geographic_clusters', 'temporal_clusters', 'chain_migration', "
-                            "'name_reuse', 'occupation_shifts', 'parallel_lives', "
-                            "'disappearances', 'statistical_outliers'"
-                        ),
-                    ),
-                    "max_results": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Maximum findings to return per category (default: 10, max: 20)",
-                    ),
-                },
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="analyze_migration_patterns",
-            description=(
-                "Extract all location changes across people and generations. Returns a timeline "
-                "of geographic movements grouped by family line. Highlights chain migration when "
-                "multiple families moved to/from the same place in the same period."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "surname": types.Schema(
-                        type=types.Type.STRING,
-                        description="Filter to one family line (optional)",
-                    ),
-                    "start_year": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Earliest year to include (optional)",
-                    ),
-                    "end_year": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Latest year to include (optional)",
-                    ),
-                },
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="find_data_quality_issues",
-            description=(
-                "Find people missing key data or with suspicious records. Useful for identifying "
-                "gaps in the family tree."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "issue_type": types.Schema(
-                        type=types.Type.STRING,
-                        description=(
-                            "Type of data quality issue: 'missing_birth', 'missing_death', "
-                            "'missing_parents', 'no_sources', 'no_death_for_old', "
-                            "'impossible_dates', 'potential_duplicates'"
-                        ),
-                    ),
-                    "max_results": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Maximum results to return (default: 20, max: 50)",
-                    ),
-                },
-                required=["issue_type"],
-            ),
-        ),
-        # Phase 6 - Tier 3: Cultural Patterns
-        types.FunctionDeclaration(
-            name="analyze_naming_patterns",
-            description=(
-                "Find naming traditions: children named after grandparents, recurring given names "
-                "across generations, necronyms (reusing names of deceased children)."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "surname": types.Schema(
-                        type=types.Type.STRING,
-                        description="Filter to one family line (optional)",
-                    ),
-                    "max_generations": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="How many generations to analyze (default: 5)",
-                    ),
-                },
-            ),
-        ),
-        types.FunctionDeclaration(
-            name="get_occupation_summary",
-            description=(
-                "List all occupations found in events/attributes, grouped by time period and "
-                "location. Highlights occupation transitions within same person's life "
-                "(e.g., farmer → factory worker) and occupation clusters (many people in same "
-                "trade in same place)."
-            ),
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "surname": types.Schema(
-                        type=types.Type.STRING,
-                        description="Filter to one family line (optional)",
-                    ),
-                    "start_year": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Earliest year to include (optional)",
-                    ),
-                    "end_year": types.Schema(
-                        type=types.Type.INTEGER,
-                        description="Latest year to include (optional)",
-                    ),
-                },
-            ),
-        ),
-    ]
+assert set(_TOOL_DISPATCH) == {
+    declaration.name for declaration in _TOOL_DECLARATIONS
+}, "Tool dispatch table and function declarations are out of sync"
 
 
 def execute_tool_call(
@@ -663,45 +704,164 @@ def execute_tool_call(
     Returns:
         Tool result as a string
     """
-    ctx = _ToolContext(deps)
-
-    if tool_name == "get_current_date":
-        return get_current_date(ctx)
-    elif tool_name == "search_genealogy_database":
-        return search_genealogy_database(ctx, **tool_args)
-    elif tool_name == "filter_people":
-        return filter_people(ctx, **tool_args)
-    elif tool_name == "filter_events":
-        return filter_events(ctx, **tool_args)
-    elif tool_name == "get_data_quality_issues":
-        return get_data_quality_issues(ctx, **tool_args)
-    elif tool_name == "update_person_field":
-        return update_person_field(ctx, **tool_args)
-    elif tool_name == "add_event_to_person":
-        return add_event_to_person(ctx, **tool_args)
-    # Phase 6 - Tier 1: Deep Record Access
-    elif tool_name == "get_person_full_details":
-        return get_person_full_details(ctx, **tool_args)
-    elif tool_name == "get_family_details":
-        return get_family_details(ctx, **tool_args)
-    elif tool_name == "find_relationship_path":
-        return find_relationship_path(ctx, **tool_args)
-    # Phase 6 - Tier 2: Whole-Tree Analytics
-    elif tool_name == "get_tree_statistics":
-        return get_tree_statistics(ctx)
-    elif tool_name == "find_coincidences_and_clusters":
-        return find_coincidences_and_clusters(ctx, **tool_args)
-    elif tool_name == "analyze_migration_patterns":
-        return analyze_migration_patterns(ctx, **tool_args)
-    elif tool_name == "find_data_quality_issues":
-        return find_data_quality_issues(ctx, **tool_args)
-    # Phase 6 - Tier 3: Cultural Patterns
-    elif tool_name == "analyze_naming_patterns":
-        return analyze_naming_patterns(ctx, **tool_args)
-    elif tool_name == "get_occupation_summary":
-        return get_occupation_summary(ctx, **tool_args)
-    else:
+    tool = _TOOL_DISPATCH.get(tool_name)
+    if tool is None:
         return f"Unknown tool: {tool_name}"
+    return tool(_ToolContext(deps), **tool_args)
+
+
+def _call_signature(tool_name: str, tool_args: dict[str, Any]) -> tuple[str, bytes]:
+    """Return a hashable signature identifying a tool call."""
+    return tool_name, orjson.dumps(tool_args, option=orjson.OPT_SORT_KEYS, default=str)
+
+
+def _elide_tool_results(content: types.Content) -> types.Content:
+    """Return a copy of a tool result turn with long results elided.
+
+    Used for tool results the model has already seen in earlier iterations,
+    so that they are not sent again in full with every following request.
+    """
+    parts = []
+    for part in content.parts:
+        response = part.function_response
+        result = (response.response or {}).get("result") if response else None
+        if isinstance(result, str) and len(result) > _ELIDE_TOOL_RESULT_LENGTH:
+            summary = f"<{response.name} result elided, {len(result)} characters>"
+            part = types.Part.from_function_response(
+                name=response.name, response={"result": summary}
+            )
+        parts.append(part)
+    return types.Content(role=content.role, parts=parts)
+
+
+def _run_tool_calls_concurrently(
+    calls: list[tuple[str, dict[str, Any]]],
+    deps: AgentDeps,
+) -> list[str]:
+    """Run tool calls on the shared thread pool, returning results in order.
+
+    Calls that don't finish within the timeout, whether still running or
+    still waiting for a free worker, return an error message instead, so a
+    slow tool can't stall the whole turn.
+    """
+    # tools need an app context, which is not shared with worker threads
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def run(call: tuple[str, dict[str, Any]]) -> str:
+        tool_name, tool_args = call
+        if app is None:
+            return execute_tool_call(tool_name, tool_args, deps)
+        with app.app_context():
+            return execute_tool_call(tool_name, tool_args, deps)
+
+    executor = _TOOL_EXECUTOR
+    futures = [executor.submit(run, call) for call in calls]
+    done, _ = wait(futures, timeout=_TOOL_CALL_TIMEOUT)
+
+    logger = get_logger()
+    results = []
+    for (tool_name, _), future in zip(calls, futures):
+        if future in done:
+            results.append(future.result())
+            continue
+        if future.cancel():
+            logger.warning(
+                "Tool call %s timed out waiting for a free worker", tool_name
+            )
+        else:
+            # its result is discarded when it finishes
+            logger.warning(
+                "Tool call %s timed out after %s seconds and is still running",
+                tool_name,
+                _TOOL_CALL_TIMEOUT,
+            )
+        results.append(
+            f"Error: {tool_name} timed out after {_TOOL_CALL_TIMEOUT} seconds."
+        )
+    return results
+
+
+def _execute_tool_calls(
+    calls: list[tuple[str, dict[str, Any]]],
+    deps: AgentDeps,
+    cache: dict[tuple[str, bytes], str] | None = None,
+    signatures: list[tuple[str, bytes]] | None = None,
+) -> list[str]:
+    """Execute the tool calls requested in one model turn.
+
+    Read-only calls are independent of each other and run concurrently, and
+    identical read-only calls are only executed once. If any write tool is
+    requested, all calls of the turn run sequentially in the order given by
+    the model.
+
+    Args:
+        calls: List of (tool name, tool arguments) tuples
+        deps: Agent dependencies (tree, privacy settings, etc.)
+        cache: Optional results of earlier read-only calls of the same agent
+            run, by call signature. Used for lookups and updated with the
+            new results; cleared when a write tool is called.
+        signatures: Optional call signatures, if already computed by the
+            caller
+
+    Returns:
+        Tool results as strings, in the same order as the calls
+    """
+    if any(tool_name in _WRITE_TOOLS for tool_name, _ in calls):
+        if cache is not None:
+            cache.clear()
+        return [execute_tool_call(tool_name, tool_args, deps) for tool_name, tool_args in calls]
+
+    if cache is None:
+        cache = {}
+    if signatures is None:
+        signatures = [
+            _call_signature(tool_name, tool_args) for tool_name, tool_args in calls
+        ]
+    # distinct calls that are not answered from the cache
+    pending: dict[tuple[str, bytes], tuple[str, dict[str, Any]]] = {}
+    for signature, call in zip(signatures, calls):
+        if signature not in cache:
+            pending.setdefault(signature, call)
+
+    results = dict(
+        zip(pending, _run_tool_calls_concurrently(list(pending.values()), deps))
+    )
+    for signature, result in results.items():
+        if not result.startswith("Error"):
+            cache[signature] = result
+    return [
+        results[signature] if signature in results else cache[signature]
+        for signature in signatures
+    ]
+
+
+def _respond_to_function_calls(
+    content: types.Content,
+    deps: AgentDeps,
+    cache: dict[tuple[str, bytes], str],
+) -> tuple[list[tuple[str, bytes]], types.Content]:
+    """Execute the function calls of a model turn.
+
+    Returns the signatures of the calls, computed once for deduplication,
+    caching and repeat detection, and the turn with the function responses
+    to send back to the model.
+    """
+    # the SDK already returns the arguments as a plain dict
+    calls = [
+        (part.function_call.name, part.function_call.args or {})
+        for part in content.parts
+        if part.function_call is not None
+    ]
+    signatures = [_call_signature(tool_name, tool_args) for tool_name, tool_args in calls]
+    results = _execute_tool_calls(calls, deps, cache=cache, signatures=signatures)
+    function_response_parts = [
+        types.Part.from_function_response(
+            name=tool_name,
+            response={"result": result},
+        )
+        for (tool_name, _), result in zip(calls, results)
+    ]
+    return signatures, types.Content(role="user", parts=function_response_parts)
 
 
 def run_agent(
@@ -710,6 +870,10 @@ def run_agent(
     model_name: str,
     system_prompt_override: str | None = None,
     history: list[types.Content] | None = None,
+    context_cache_ttl: int = 0,
+    google_search: bool = True,
+    service_tier: str | None = None,
+    max_iterations: int = 10,
 ) -> types.GenerateContentResponse:
     """Run the Gemini agent with tool calling loop.
 
@@ -722,6 +886,13 @@ def run_agent(
         model_name: The Gemini model name (e.g., "gemini-3-flash")
         system_prompt_override: Optional override for the system prompt
         history: Optional conversation history as Gemini Content objects
+        context_cache_ttl: If positive, keep the system prompt and tool
+            declarations in an explicit Gemini context cache with this TTL
+            (in seconds) instead of sending them with every request
+        google_search: Whether to enable Google Search grounding
+        service_tier: Optional Gemini service tier, e.g. "priority"
+        max_iterations: Maximum number of model turns before the model is
+            asked for its final answer
 
     Returns:
         The final GenerateContentResponse from Gemini
@@ -730,10 +901,10 @@ def run_agent(
     if not api_key:
         raise ValueError("GEMINI_API_KEY environment variable is not set")
 
-    client = genai.Client(api_key=api_key)
+    client = _get_client(api_key)
+    service_tier = _get_service_tier(service_tier)
 
     system_prompt = system_prompt_override or SYSTEM_PROMPT
-    tool_declarations = _make_tool_wrappers(deps)
 
     contents: list[types.Content] = []
     if history:
@@ -741,30 +912,47 @@ def run_agent(
 
     contents.append(types.Content(role="user", parts=[types.Part.from_text(text=prompt)]))
 
-    config = types.GenerateContentConfig(
-        system_instruction=system_prompt,
-        tools=[
-            types.Tool(
-                function_declarations=tool_declarations,
-                google_search=GoogleSearch(),
-            ),
-        ],
-        temperature=0.2,
+    cached_content = None
+    if context_cache_ttl > 0:
+        cached_content = _get_context_cache_name(
+            client, model_name, system_prompt, google_search, context_cache_ttl
+        )
+    config = _get_generate_config(
+        system_prompt, cached_content, google_search, service_tier=service_tier
+    )
+    final_config = _get_generate_config(
+        system_prompt,
+        cached_content,
+        google_search,
+        final=True,
+        service_tier=service_tier,
     )
 
-    max_iterations = 10
-    iteration = 0
+    max_iterations = max(1, max_iterations)
     has_function_call = False
+    force_synthesis = False
+    # positions of the tool result turns in contents that are still complete
+    tool_result_turns: list[int] = []
+    # results of read-only tool calls made so far in this run
+    tool_results: dict[tuple[str, bytes], str] = {}
+    # hashes of the sets of tool calls of the most recent turns
+    recent_turns: deque[int] = deque(maxlen=2 * _MAX_REPEATED_TOOL_TURNS)
 
     for iteration in range(max_iterations):
+        # On the last turn, or if the model is going in circles, ask for the
+        # answer right away, with function calling disabled
+        final_turn = force_synthesis or iteration == max_iterations - 1
+        if final_turn and has_function_call:
+            contents.append(_FORCED_SYNTHESIS_CONTENT)
         response = client.models.generate_content(
             model=model_name,
             contents=contents,
-            config=config,
+            config=final_config if final_turn else config,
         )
 
         # Check if the model wants to call tools
         if not response.candidates or not response.candidates[0].content.parts:
+            has_function_call = False
             break
 
         has_function_call = any(
@@ -772,46 +960,44 @@ def run_agent(
             for part in response.candidates[0].content.parts
         )
 
-        if not has_function_call:
+        if not has_function_call or final_turn:
             break
 
         # Add the model's response (with function calls) to history
         contents.append(response.candidates[0].content)
 
-        # Execute each function call and collect results
-        function_response_parts = []
-        for part in response.candidates[0].content.parts:
-            if part.function_call is not None:
-                tool_name = part.function_call.name
-                tool_args = dict(part.function_call.args) if part.function_call.args else {}
-
-                result = execute_tool_call(tool_name, tool_args, deps)
-
-                function_response_parts.append(
-                    types.Part.from_function_response(
-                        name=tool_name,
-                        response={"result": result},
-                    )
-                )
-
-        # Add tool results back to the conversation
-        contents.append(types.Content(role="user", parts=function_response_parts))
-
-    # If we hit the max iterations and the last response still has function calls,
-    # force a final text response by sending tool results with a prompt to synthesize
-    if iteration == max_iterations - 1 and has_function_call:
-        contents.append(
-            types.Content(
-                role="user",
-                parts=[types.Part.from_text(
-                    text="Please provide your answer now based on the information you've gathered. Synthesize what you've learned into a helpful response."
-                )],
-            )
+        # Execute the function calls and add the results to the conversation
+        signatures, function_responses = _respond_to_function_calls(
+            response.candidates[0].content, deps, tool_results
+        )
+        tool_result_turns.append(len(contents))
+        contents.append(function_responses)
+
+        # Elide long results of older turns, which the model has already used
+        while len(tool_result_turns) > _KEEP_TOOL_RESULT_TURNS:
+            index = tool_result_turns.pop(0)
+            contents[index] = _elide_tool_results(contents[index])
+
+        # Ask for the answer if the model keeps cycling through the same calls
+        turn_hash = hash(tuple(sorted(signatures)))
+        recent_turns.append(turn_hash)
+        if recent_turns.count(turn_hash) >= _MAX_REPEATED_TOOL_TURNS:
+            get_logger().warning("Agent is repeating tool calls, forcing an answer")
+            force_synthesis = True
+
+    # With a context cache, function calling can't be disabled for the final
+    # turn. If the model still called tools there, run them and ask once more.
+    if has_function_call:
+        contents.append(response.candidates[0].content)
+        _, function_responses = _respond_to_function_calls(
+            response.candidates[0].content, deps, tool_results
         )
+        contents.append(function_responses)
+        contents.append(_FORCED_SYNTHESIS_CONTENT)
         response = client.models.generate_content(
             model=model_name,
             contents=contents,
-            config=config,
+            config=final_config,
         )
 
     return response
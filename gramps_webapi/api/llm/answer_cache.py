@@ -0,0 +1,67 @@
+"""Cache for AI chat answers to repeated questions."""
+
+from __future__ import annotations
+
+import hashlib
+import re
+
+from flask import current_app
+
+from ..cache import get_db_last_change_timestamp, request_cache
+from .grounding_policy import normalize_search_grounding_mode
+
+ANSWER_CACHE_PREFIX = "llm_answer_"
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a chat query for cache lookups.
+
+    Case, repeated whitespace and trailing punctuation are ignored.
+    """
+    normalized = " ".join(query.lower().split())
+    return _TRAILING_PUNCTUATION.sub("", normalized)
+
+
+def get_answer_cache_key(tree: str, include_private: bool, query: str) -> str | None:
+    """Get the cache key for an answer, or None if answers can't be cached.
+
+    The key depends on the tree and its last change, the privacy permission,
+    the model, system prompt, search grounding mode and iteration limit, and
+    the normalized query. Returns None if
+    the answer cache is disabled or the last change of the tree is unknown.
+    """
+    config = current_app.config
+    if not config.get("LLM_ANSWER_CACHE_TIMEOUT"):
+        return None
+    db_timestamp = get_db_last_change_timestamp(tree)
+    if db_timestamp is None:
+        return None
+    key_parts = (
+        tree,
+        str(db_timestamp),
+        str(int(include_private)),
+        config.get("LLM_MODEL") or "",
+        config.get("LLM_SYSTEM_PROMPT") or "",
+        normalize_search_grounding_mode(config.get("LLM_SEARCH_GROUNDING")),
+        str(config.get("LLM_MAX_ITERATIONS", 10)),
+        normalize_query(query),
+    )
+    digest = hashlib.sha256("\x00".join(key_parts).encode()).hexdigest()
+    return ANSWER_CACHE_PREFIX + digest
+
+
+def get_cached_answer(cache_key: str | None) -> str | None:
+    """Return a cached answer, if any."""
+    if cache_key is None:
+        return None
+    return request_cache.get(cache_key)
+
+
+def cache_answer(cache_key: str | None, answer: str) -> None:
+    """Store an answer in the cache."""
+    if cache_key is None:
+        return None
+    timeout = current_app.config.get("LLM_ANSWER_CACHE_TIMEOUT")
+    request_cache.set(cache_key, answer, timeout=timeout)
@@ -0,0 +1,97 @@
+#
+# Gramps Web API - A RESTful API for the Gramps genealogy program
+#
+# Copyright (C) 2025      David Straub
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Decide whether a chat request gets Google Search grounding."""
+
+from __future__ import annotations
+
+import re
+from typing import Any
+
+VALID_SEARCH_GROUNDING_MODES = frozenset({"off", "auto", "on"})
+
+# Search stays enabled for every chat unless "auto" or "off" is configured
+DEFAULT_SEARCH_GROUNDING_MODE = "on"
+
+# Phrases suggesting the answer needs context from outside the family tree.
+CONTEXT_GAP_KEYWORDS = (
+    "history",
+    "historical",
+    "the war",
+    "war ",
+    "wars",
+    "immigra",
+    "emigra",
+    "migrat",
+    "what was life like",
+    "living conditions",
+    "why did",
+    "why would",
+    "famine",
+    "epidemic",
+    "century",
+    "culture",
+    "tradition",
+    "occupation",
+    "surprise me",
+    "interesting",
+    "tell me about",
+    "story",
+    "context",
+)
+
+
+# All keywords as one pattern, matched anywhere in the query (so prefixes like
+# "immigra" also match "immigrated")
+_CONTEXT_GAP_RE = re.compile(
+    "|".join(re.escape(word) for word in CONTEXT_GAP_KEYWORDS), re.IGNORECASE
+)
+
+
+def normalize_search_grounding_mode(mode: Any) -> str:
+    """Return a valid search grounding mode, falling back to the default."""
+    if isinstance(mode, str):
+        mode = mode.lower().strip()
+        if mode in VALID_SEARCH_GROUNDING_MODES:
+            return mode
+    return DEFAULT_SEARCH_GROUNDING_MODE
+
+
+def _is_context_gap_query(query: str) -> bool:
+    """Whether the query likely needs context beyond the family tree."""
+    return _CONTEXT_GAP_RE.search(query) is not None
+
+
+def decide_chat_grounding(mode: Any, query: str) -> dict[str, Any]:
+    """Decide whether to enable Google Search grounding for a chat query.
+
+    In "auto" mode, search is only enabled if the query looks like it needs
+    web context (e.g. history, migration, living conditions); questions that
+    can be answered from the tree alone skip the extra grounding round-trip.
+
+    Returns a dictionary with the effective mode and whether to use search.
+    """
+    mode = normalize_search_grounding_mode(mode)
+    if mode == "on":
+        use_search = True
+    elif mode == "off":
+        use_search = False
+    else:
+        use_search = _is_context_gap_query(query)
+    return {"mode": mode, "use_search": use_search}
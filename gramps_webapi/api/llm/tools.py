@@ -21,11 +21,16 @@
 
 from __future__ import annotations
 
+import hashlib
 import json
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from functools import wraps
+from functools import lru_cache, wraps
 from typing import Any, Protocol, TypeVar
 
+from flask import current_app
+
 T = TypeVar("T")
 
 
@@ -34,7 +39,9 @@ class RunContext(Protocol[T]):
 
     deps: T
 
-from ..resources.filters import apply_filter
+from ..cache import get_db_last_change_timestamp, request_cache
+from ..people_families_cache import CachePeopleFamiliesProxy
+from ..resources.filters import apply_filter, get_rule_list
 from ..resources.util import get_one_relationship
 from ..search import get_semantic_search_indexer
 from ..search.text import obj_strings_from_object
@@ -64,6 +71,20 @@ def _build_date_expression(before: str, after: str) -> str:
     return ""
 
 
+@lru_cache(maxsize=None)
+def _available_rule_names(namespace: str) -> frozenset[str]:
+    """Return the names of the filter rules available for a namespace.
+
+    Rules (including addon rules) are registered at startup, so the set is
+    computed once per namespace.
+    """
+    return frozenset(rule.__name__ for rule in get_rule_list(namespace))  # type: ignore
+
+
+# Depths at which relationships for result prefixes are searched, in order
+_RELATIONSHIP_PREFIX_DEPTHS = (3, 10)
+
+
 def _get_relationship_prefix(db_handle, anchor_person, result_person, logger) -> str:
     """Get a relationship string prefix for a result person.
 
@@ -77,12 +98,18 @@ def _get_relationship_prefix(db_handle, anchor_person, result_person, logger) ->
         A formatted relationship prefix like "[grandfather] " or empty string
     """
     try:
-        rel_string, dist_orig, dist_other = get_one_relationship(
-            db_handle=db_handle,
-            person1=anchor_person,
-            person2=result_person,
-            depth=10,
-        )
+        # Most results of relationship filters are close kin, so try a
+        # shallow search first. get_one_relationship itself probes depth 5
+        # before the full depth, so a miss costs only the extra shallow pass.
+        for depth in _RELATIONSHIP_PREFIX_DEPTHS:
+            rel_string, dist_orig, dist_other = get_one_relationship(
+                db_handle=db_handle,
+                person1=anchor_person,
+                person2=result_person,
+                depth=depth,
+            )
+            if dist_orig > -1:
+                break
         if rel_string and rel_string.lower() not in ["", "self"]:
             return f"[{rel_string}] "
         elif dist_orig == 0 and dist_other == 0:
@@ -97,6 +124,65 @@ def _get_relationship_prefix(db_handle, anchor_person, result_person, logger) ->
     return ""
 
 
+# Relationship prefixes keyed by tree, privacy, tree revision and person handles
+_RELATIONSHIP_PREFIX_CACHE: OrderedDict[tuple, str] = OrderedDict()
+_RELATIONSHIP_PREFIX_CACHE_SIZE = 4096
+_RELATIONSHIP_PREFIX_CACHE_LOCK = threading.Lock()
+
+
+def _get_cached_relationship_prefix(
+    deps: AgentDeps, revision, db_handle, anchor_person, result_person, logger
+) -> str:
+    """Get a relationship string prefix, reusing earlier results.
+
+    The same anchor/result pairs recur across tool calls of a conversation.
+    Results are only reused while the tree revision is unchanged; nothing is
+    cached if the revision is unknown.
+    """
+    if revision is None:
+        return _get_relationship_prefix(
+            db_handle, anchor_person, result_person, logger
+        )
+    key = (
+        deps.tree,
+        deps.include_private,
+        revision,
+        anchor_person.handle,
+        result_person.handle,
+    )
+    with _RELATIONSHIP_PREFIX_CACHE_LOCK:
+        if key in _RELATIONSHIP_PREFIX_CACHE:
+            _RELATIONSHIP_PREFIX_CACHE.move_to_end(key)
+            return _RELATIONSHIP_PREFIX_CACHE[key]
+    prefix = _get_relationship_prefix(db_handle, anchor_person, result_person, logger)
+    with _RELATIONSHIP_PREFIX_CACHE_LOCK:
+        _RELATIONSHIP_PREFIX_CACHE[key] = prefix
+        if len(_RELATIONSHIP_PREFIX_CACHE) > _RELATIONSHIP_PREFIX_CACHE_SIZE:
+            _RELATIONSHIP_PREFIX_CACHE.popitem(last=False)
+    return prefix
+
+
+class _RelationshipDbProxy(CachePeopleFamiliesProxy):
+    """People and families proxy that keeps every object it has looked up.
+
+    The relationship calculator fetches the same parents, children and
+    families many times while walking the tree. Only the objects it actually
+    visits are loaded, instead of the whole tree.
+    """
+
+    def get_person_from_handle(self, handle: str):
+        """Get a person, loading it from the database on first use."""
+        if handle not in self._people_cache:
+            self._people_cache[handle] = self.db.get_person_from_handle(handle)
+        return self._people_cache[handle]
+
+    def get_family_from_handle(self, handle: str):
+        """Get a family, loading it from the database on first use."""
+        if handle not in self._family_cache:
+            self._family_cache[handle] = self.db.get_family_from_handle(handle)
+        return self._family_cache[handle]
+
+
 def _apply_gramps_filter(
     ctx: RunContext[AgentDeps],
     namespace: str,
@@ -169,7 +255,9 @@ def _apply_gramps_filter(
 
         # Get the anchor person for relationship calculation if requested
         anchor_person = None
+        revision = None
         if show_relation_with and namespace == "Person":
+            revision = get_db_last_change_timestamp(ctx.deps.tree)
             try:
                 anchor_person = db_handle.get_person_from_gramps_id(show_relation_with)
                 if not anchor_person:
@@ -182,6 +270,9 @@ def _apply_gramps_filter(
                     "Error fetching anchor person %s: %s", show_relation_with, e
                 )
 
+        # proxy shared by the relationship calculations of all results
+        rel_db_handle = None
+
         # Get the appropriate method to fetch objects
         get_method_name = f"get_{namespace.lower()}_from_handle"
         get_method = getattr(db_handle, get_method_name)
@@ -215,8 +306,10 @@ def _apply_gramps_filter(
 
                 # Add relationship prefix if anchor person is set
                 if anchor_person and namespace == "Person":
-                    rel_prefix = _get_relationship_prefix(
-                        db_handle, anchor_person, obj, logger
+                    if rel_db_handle is None:
+                        rel_db_handle = _RelationshipDbProxy(db_handle)
+                    rel_prefix = _get_cached_relationship_prefix(
+                        ctx.deps, revision, rel_db_handle, anchor_person, obj, logger
                     )
                     content = rel_prefix + content
 
@@ -293,6 +386,105 @@ def log_tool_call(func):
     return wrapper
 
 
+# Results of read-only tools, most recently used last. Larger results are
+# not kept in memory; they are still stored by persist_tool_result where used.
+_TOOL_RESULT_CACHE: OrderedDict[tuple, str] = OrderedDict()
+_TOOL_RESULT_CACHE_SIZE = 256
+_TOOL_RESULT_CACHE_MAX_LENGTH = 250_000
+_TOOL_RESULT_CACHE_LOCK = threading.Lock()
+
+
+def cache_tool_result(func):
+    """Decorator to cache the results of a read-only tool.
+
+    The cache key includes the tree's last change timestamp, so results are
+    reused only while the tree is unchanged; writes by the agent's own write
+    tools change it as well. Nothing is cached if that timestamp is unknown,
+    if the tool returned an error or if the result is very large.
+
+    The timestamp is the modification time of the tree's meta_data.db file.
+    PostgreSQL and shared-database trees don't have that file, so their tool
+    results are never cached.
+    """
+
+    @wraps(func)
+    def wrapper(ctx, *args, **kwargs):
+        revision = get_db_last_change_timestamp(ctx.deps.tree)
+        key = (
+            ctx.deps.tree,
+            ctx.deps.include_private,
+            ctx.deps.max_context_length,
+            revision,
+            func.__name__,
+            args,
+            tuple(sorted(kwargs.items())),
+        )
+        try:
+            hash(key)
+        except TypeError:
+            revision = None
+        if revision is None:
+            return func(ctx, *args, **kwargs)
+
+        with _TOOL_RESULT_CACHE_LOCK:
+            if key in _TOOL_RESULT_CACHE:
+                _TOOL_RESULT_CACHE.move_to_end(key)
+                return _TOOL_RESULT_CACHE[key]
+
+        result = func(ctx, *args, **kwargs)
+        if len(result) <= _TOOL_RESULT_CACHE_MAX_LENGTH and not result.startswith(
+            "Error"
+        ):
+            with _TOOL_RESULT_CACHE_LOCK:
+                _TOOL_RESULT_CACHE[key] = result
+                if len(_TOOL_RESULT_CACHE) > _TOOL_RESULT_CACHE_SIZE:
+                    _TOOL_RESULT_CACHE.popitem(last=False)
+        return result
+
+    return wrapper
+
+
+TOOL_RESULT_CACHE_PREFIX = "llm_tool_"
+
+
+def persist_tool_result(func):
+    """Decorator to store the results of an expensive tool in the request cache.
+
+    Unlike ``cache_tool_result``, results are kept on disk and shared between
+    processes and restarts. The key includes the tree's last change timestamp,
+    so stored results are only reused while the tree is unchanged. Entries
+    expire after ``LLM_TOOL_RESULT_CACHE_TIMEOUT`` seconds, so results for
+    old revisions don't crowd out other request cache entries.
+    """
+
+    @wraps(func)
+    def wrapper(ctx, *args, **kwargs):
+        timeout = current_app.config.get("LLM_TOOL_RESULT_CACHE_TIMEOUT")
+        revision = get_db_last_change_timestamp(ctx.deps.tree)
+        if not timeout or revision is None:
+            return func(ctx, *args, **kwargs)
+        key_parts = (
+            ctx.deps.tree,
+            str(revision),
+            str(int(ctx.deps.include_private)),
+            func.__name__,
+            repr(args),
+            repr(sorted(kwargs.items())),
+        )
+        digest = hashlib.sha256("\x00".join(key_parts).encode()).hexdigest()
+        cache_key = TOOL_RESULT_CACHE_PREFIX + digest
+
+        result = request_cache.get(cache_key)
+        if result is not None:
+            return result
+        result = func(ctx, *args, **kwargs)
+        if not result.startswith("Error"):
+            request_cache.set(cache_key, result, timeout=timeout)
+        return result
+
+    return wrapper
+
+
 @log_tool_call
 def get_current_date(_ctx: RunContext[AgentDeps]) -> str:
     """Returns today's date in ISO format (YYYY-MM-DD)."""
@@ -390,6 +582,7 @@ def search_genealogy_database(
 
 
 @log_tool_call
+@cache_tool_result
 def filter_people(
     ctx: RunContext[AgentDeps],
     given_name: str = "",
@@ -505,10 +698,7 @@ def filter_people(
 
     if degrees_of_separation_from:
         # Check if DegreesOfSeparation filter is available (from FilterRules addon)
-        from ..resources.filters import get_rule_list
-
-        available_rules = [rule.__name__ for rule in get_rule_list("Person")]  # type: ignore
-        if "DegreesOfSeparation" in available_rules:
+        if "DegreesOfSeparation" in _available_rule_names("Person"):
             rules.append(
                 {
                     "name": "DegreesOfSeparation",
@@ -562,6 +752,7 @@ def filter_people(
 
 
 @log_tool_call
+@cache_tool_result
 def filter_events(
     ctx: RunContext[AgentDeps],
     event_type: str = "",
@@ -649,6 +840,7 @@ def filter_events(
 
 
 @log_tool_call
+@cache_tool_result
 def get_data_quality_issues(
     ctx: RunContext[AgentDeps],
     issue_type: str = "all",
@@ -973,6 +1165,7 @@ def add_event_to_person(
 
 
 @log_tool_call
+@cache_tool_result
 def get_person_full_details(
     ctx: RunContext[AgentDeps],
     gramps_id: str = "",
@@ -1048,6 +1241,7 @@ def get_person_full_details(
 
 
 @log_tool_call
+@cache_tool_result
 def get_family_details(
     ctx: RunContext[AgentDeps],
     family_handle: str = "",
@@ -1129,6 +1323,7 @@ def get_family_details(
 
 
 @log_tool_call
+@cache_tool_result
 def find_relationship_path(
     ctx: RunContext[AgentDeps],
     person1_id: str,
@@ -1167,7 +1362,7 @@ def find_relationship_path(
 
         # Use the existing get_one_relationship helper
         rel_string, dist_orig, dist_other = get_one_relationship(
-            db_handle=db_handle,
+            db_handle=_RelationshipDbProxy(db_handle),
             person1=person1,
             person2=person2,
             depth=20,  # Allow deeper searches for distant relationships
@@ -1202,6 +1397,7 @@ def find_relationship_path(
 
 
 @log_tool_call
+@cache_tool_result
 def get_tree_statistics(ctx: RunContext[AgentDeps]) -> str:
     """Get aggregate statistics about the entire family tree.
 
@@ -1244,8 +1440,7 @@ def get_tree_statistics(ctx: RunContext[AgentDeps]) -> str:
 
         # Surname frequency
         surname_freq = {}
-        for person_handle in db_handle.iter_person_handles():
-            person = db_handle.get_person_from_handle(person_handle)
+        for person in db_handle.iter_people():
             if not ctx.deps.include_private and person.private:
                 continue
             surname = person.get_primary_name().get_surname()
@@ -1259,8 +1454,7 @@ def get_tree_statistics(ctx: RunContext[AgentDeps]) -> str:
         # Date ranges from birth/death events
         birth_years = []
         death_years = []
-        for event_handle in db_handle.iter_event_handles():
-            event = db_handle.get_event_from_handle(event_handle)
+        for event in db_handle.iter_events():
             if not ctx.deps.include_private and event.private:
                 continue
 
@@ -1281,8 +1475,7 @@ def get_tree_statistics(ctx: RunContext[AgentDeps]) -> str:
 
         # Average lifespan (only for people with both birth and death dates)
         lifespans = []
-        for person_handle in db_handle.iter_person_handles():
-            person = db_handle.get_person_from_handle(person_handle)
+        for person in db_handle.iter_people():
             if not ctx.deps.include_private and person.private:
                 continue
 
@@ -1308,8 +1501,7 @@ def get_tree_statistics(ctx: RunContext[AgentDeps]) -> str:
 
         # Average family size
         children_counts = []
-        for family_handle in db_handle.iter_family_handles():
-            family = db_handle.get_family_from_handle(family_handle)
+        for family in db_handle.iter_families():
             if not ctx.deps.include_private and family.private:
                 continue
             children_counts.append(len(family.get_child_ref_list()))
@@ -1321,8 +1513,7 @@ def get_tree_statistics(ctx: RunContext[AgentDeps]) -> str:
 
         # Top places
         place_freq = {}
-        for event_handle in db_handle.iter_event_handles():
-            event = db_handle.get_event_from_handle(event_handle)
+        for event in db_handle.iter_events():
             if not ctx.deps.include_private and event.private:
                 continue
 
@@ -1351,6 +1542,8 @@ def get_tree_statistics(ctx: RunContext[AgentDeps]) -> str:
 
 
 @log_tool_call
+@cache_tool_result
+@persist_tool_result
 def find_coincidences_and_clusters(
     ctx: RunContext[AgentDeps],
     category: str = "all",
@@ -1397,8 +1590,7 @@ def find_coincidences_and_clusters(
         if category in ["all", "geographic_clusters"]:
             place_time_clusters = {}  # (place, decade) -> list of person IDs
 
-            for person_handle in db_handle.iter_person_handles():
-                person = db_handle.get_person_from_handle(person_handle)
+            for person in db_handle.iter_people():
                 if not ctx.deps.include_private and person.private:
                     continue
 
@@ -1444,8 +1636,7 @@ def find_coincidences_and_clusters(
         if category in ["all", "temporal_clusters"]:
             event_year_data = {}  # (event_type, year) -> list of (gramps_id, name)
 
-            for event_handle in db_handle.iter_event_handles():
-                event = db_handle.get_event_from_handle(event_handle)
+            for event in db_handle.iter_events():
                 if not ctx.deps.include_private and event.private:
                     continue
 
@@ -1459,7 +1650,7 @@ def find_coincidences_and_clusters(
                         event_year_data[key] = []
                     # Find people linked to this event (limit stored to 6 for memory)
                     if len(event_year_data[key]) < 6:
-                        for class_name, ref_handle in db_handle.find_backlink_handles(event_handle, ['Person']):
+                        for class_name, ref_handle in db_handle.find_backlink_handles(event.handle, ['Person']):
                             person = db_handle.get_person_from_handle(ref_handle)
                             if person:
                                 event_year_data[key].append((person.gramps_id, person.get_primary_name().get_name()))
@@ -1482,8 +1673,7 @@ def find_coincidences_and_clusters(
 
         # Name Reuse (Necronyms) - children named after deceased siblings
         if category in ["all", "name_reuse"]:
-            for family_handle in db_handle.iter_family_handles():
-                family = db_handle.get_family_from_handle(family_handle)
+            for family in db_handle.iter_families():
                 if not ctx.deps.include_private and family.private:
                     continue
 
@@ -1544,8 +1734,7 @@ def find_coincidences_and_clusters(
         if category in ["all", "statistical_outliers"]:
             # Very large families
             large_families = []
-            for family_handle in db_handle.iter_family_handles():
-                family = db_handle.get_family_from_handle(family_handle)
+            for family in db_handle.iter_families():
                 if not ctx.deps.include_private and family.private:
                     continue
 
@@ -1572,8 +1761,7 @@ def find_coincidences_and_clusters(
 
             # Very long lives (90+ years)
             long_lived = []
-            for person_handle in db_handle.iter_person_handles():
-                person = db_handle.get_person_from_handle(person_handle)
+            for person in db_handle.iter_people():
                 if not ctx.deps.include_private and person.private:
                     continue
 
@@ -1620,6 +1808,7 @@ def find_coincidences_and_clusters(
 
 
 @log_tool_call
+@cache_tool_result
 def analyze_migration_patterns(
     ctx: RunContext[AgentDeps],
     surname: str = "",
@@ -1653,8 +1842,7 @@ def analyze_migration_patterns(
 
         migrations = []  # List of (year, person_name, surname, from_place, to_place)
 
-        for person_handle in db_handle.iter_person_handles():
-            person = db_handle.get_person_from_handle(person_handle)
+        for person in db_handle.iter_people():
             if not ctx.deps.include_private and person.private:
                 continue
 
@@ -1775,6 +1963,7 @@ def analyze_migration_patterns(
 
 
 @log_tool_call
+@cache_tool_result
 def find_data_quality_issues(
     ctx: RunContext[AgentDeps],
     issue_type: str = "missing_birth",
@@ -1815,8 +2004,7 @@ def find_data_quality_issues(
         current_year = datetime.now().year
 
         if issue_type == "missing_birth":
-            for person_handle in db_handle.iter_person_handles():
-                person = db_handle.get_person_from_handle(person_handle)
+            for person in db_handle.iter_people():
                 if not ctx.deps.include_private and person.private:
                     continue
 
@@ -1824,8 +2012,7 @@ def find_data_quality_issues(
                     issues.append(f"[{person.get_primary_name().get_name()}](/person/{person.gramps_id}) has no birth event recorded")
 
         elif issue_type == "no_death_for_old":
-            for person_handle in db_handle.iter_person_handles():
-                person = db_handle.get_person_from_handle(person_handle)
+            for person in db_handle.iter_people():
                 if not ctx.deps.include_private and person.private:
                     continue
 
@@ -1842,8 +2029,7 @@ def find_data_quality_issues(
                                 issues.append(f"[{person.get_primary_name().get_name()}](/person/{person.gramps_id}) was born in {birth_year} but has no death record")
 
         elif issue_type == "missing_parents":
-            for person_handle in db_handle.iter_person_handles():
-                person = db_handle.get_person_from_handle(person_handle)
+            for person in db_handle.iter_people():
                 if not ctx.deps.include_private and person.private:
                     continue
 
@@ -1852,8 +2038,7 @@ def find_data_quality_issues(
                     issues.append(f"[{person.get_primary_name().get_name()}](/person/{person.gramps_id}) has no recorded parents")
 
         elif issue_type == "impossible_dates":
-            for person_handle in db_handle.iter_person_handles():
-                person = db_handle.get_person_from_handle(person_handle)
+            for person in db_handle.iter_people():
                 if not ctx.deps.include_private and person.private:
                     continue
 
@@ -1902,6 +2087,7 @@ def find_data_quality_issues(
 
 
 @log_tool_call
+@cache_tool_result
 def analyze_naming_patterns(
     ctx: RunContext[AgentDeps],
     surname: str = "",
@@ -1936,8 +2122,7 @@ def analyze_naming_patterns(
         name_frequency = {}  # name -> count
         grandparent_naming = []  # Cases where child named after grandparent
 
-        for person_handle in db_handle.iter_person_handles():
-            person = db_handle.get_person_from_handle(person_handle)
+        for person in db_handle.iter_people():
             if not ctx.deps.include_private and person.private:
                 continue
 
@@ -2036,6 +2221,7 @@ def analyze_naming_patterns(
 
 
 @log_tool_call
+@cache_tool_result
 def get_occupation_summary(
     ctx: RunContext[AgentDeps],
     surname: str = "",
@@ -2070,8 +2256,7 @@ def get_occupation_summary(
         occupation_data = []  # List of (year, person, occupation, place)
         person_occupations = {}  # person_id -> list of (year, occupation)
 
-        for person_handle in db_handle.iter_person_handles():
-            person = db_handle.get_person_from_handle(person_handle)
+        for person in db_handle.iter_people():
             if not ctx.deps.include_private and person.private:
                 continue
 
@@ -26,7 +26,6 @@ from flask_jwt_extended import get_jwt_identity
 from gramps.gen.lib import Source, Note, Tag
 from gramps.gen.db import DbTxn
 
-from ..llm import generate_blog_post
 from ..util import (
     abort_with_message,
     check_quota_ai,
@@ -126,6 +125,9 @@ class BlogGenerateResource(ProtectedResource):
             previous_titles, featured_ids = _get_existing_blog_info(db_handle)
             logger.info("Found %d existing blog posts featuring %d people", len(previous_titles), len(featured_ids))
 
+            # import here to avoid loading the AI dependencies until needed
+            from ..llm import generate_blog_post
+
             # Single-shot Gemini call with pre-gathered context
             title, content, metadata = generate_blog_post(
                 tree=tree,
@@ -4,6 +4,7 @@ import json
 import uuid
 from datetime import datetime, timezone
 
+import sqlalchemy as sa
 from flask_jwt_extended import get_jwt_identity
 from webargs import fields
 
@@ -134,10 +135,13 @@ class ConversationResource(ProtectedResource):
         return "", 204
 
 
-def create_conversation(user_id: str, tree: str, title: str | None = None) -> Conversation:
-    """Create a new conversation."""
+def create_conversation(user_id: str, tree: str, title: str | None = None) -> str:
+    """Create a new conversation and return its ID."""
+    # keep the ID, since reading it from the expired object after commit
+    # would reload the row
+    conversation_id = str(uuid.uuid4())
     conv = Conversation(
-        id=str(uuid.uuid4()),
+        id=conversation_id,
         user_id=user_id,
         tree=tree,
         title=title,
@@ -146,7 +150,7 @@ def create_conversation(user_id: str, tree: str, title: str | None = None) -> Co
     )
     user_db.session.add(conv)
     user_db.session.commit()
-    return conv
+    return conversation_id
 
 
 def add_message(
@@ -166,10 +170,12 @@ def add_message(
     )
     user_db.session.add(msg)
 
-    # Update conversation's updated_at
-    conv = user_db.session.query(Conversation).filter_by(id=conversation_id).first()
-    if conv:
-        conv.updated_at = datetime.now(timezone.utc)
+    # Update conversation's updated_at without loading it first
+    user_db.session.execute(
+        sa.update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(updated_at=datetime.now(timezone.utc))
+    )
 
     user_db.session.commit()
     return msg
@@ -26,7 +26,6 @@ from flask import current_app
 from flask_jwt_extended import get_jwt_identity
 from gramps.gen.errors import HandleError
 
-from ..llm import generate_insight
 from ..search.text import obj_strings_from_object
 from ..search.text_semantic import (
     date_to_text,
@@ -392,6 +391,9 @@ class InsightResource(ProtectedResource):
             if db_handle:
                 db_handle.close()
 
+        # import here to avoid loading the AI dependencies until needed
+        from ..llm import generate_insight
+
         # Generate insight via Gemini (synchronous, no tools)
         insight_text, metadata = generate_insight(
             person_context=person_context,
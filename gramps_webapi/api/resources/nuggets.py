@@ -26,7 +26,6 @@ from flask import current_app, request
 from flask_jwt_extended import get_jwt_identity
 from gramps.gen.errors import HandleError
 
-from ..llm import generate_nuggets
 from ..util import (
     abort_with_message,
     check_quota_ai,
@@ -117,6 +116,9 @@ class NuggetsListResource(ProtectedResource):
                 user_id=user_id,
             )
 
+            # import here to avoid loading the AI dependencies until needed
+            from ..llm import generate_nuggets
+
             # Single-shot Gemini call with pre-gathered context (no agent loop)
             answer_text, metadata = generate_nuggets(
                 tree=tree,
@@ -27,7 +27,7 @@ from datetime import datetime
 from flask import current_app, request
 from flask_jwt_extended import get_jwt_identity
 
-from ..llm import generate_this_day
+from ..cache import get_db_last_change_timestamp
 from ..util import (
     abort_with_message,
     check_quota_ai,
@@ -63,10 +63,15 @@ class ThisDayResource(ProtectedResource):
         logger = get_logger()
         logger.info("Fetching This Day digest for %s on tree %s", month_day, tree)
 
-        # Check cache first
-        cached = ThisDayCache.query.filter_by(tree=tree, month_day=month_day).first()
+        # Check cache first. Digests depend on the user's privacy permission
+        # and are only valid until the tree is next modified (if the last
+        # change cannot be determined, cached digests are kept).
+        tree_revision = get_db_last_change_timestamp(tree)
+        cached = ThisDayCache.query.filter_by(
+            tree=tree, month_day=month_day, include_private=include_private
+        ).first()
 
-        if cached:
+        if cached and (tree_revision is None or cached.tree_revision == tree_revision):
             logger.info("Returning cached This Day digest for %s", month_day)
             return {
                 "month_day": month_day,
@@ -87,6 +92,9 @@ class ThisDayResource(ProtectedResource):
         logger.info("Generating fresh This Day digest for %s", month_day)
 
         try:
+            # import here to avoid loading the AI dependencies until needed
+            from ..llm import generate_this_day
+
             content_text, metadata = generate_this_day(
                 month=month,
                 day=day,
@@ -98,12 +106,16 @@ class ThisDayResource(ProtectedResource):
             if not content_text:
                 abort_with_message(500, "No content generated")
 
-            # Cache the result
+            # Cache the result, replacing a digest for an older tree revision
+            if cached:
+                user_db.session.delete(cached)
             cache_id = str(uuid.uuid4())
             new_cache = ThisDayCache(
                 id=cache_id,
                 tree=tree,
                 month_day=month_day,
+                include_private=include_private,
+                tree_revision=tree_revision,
                 content=content_text,
             )
             user_db.session.add(new_cache)
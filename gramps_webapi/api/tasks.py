@@ -662,6 +662,11 @@ def process_chat(
         extract_text_from_response,
         sanitize_answer,
     )
+    from gramps_webapi.api.llm.answer_cache import (
+        cache_answer,
+        get_answer_cache_key,
+        get_cached_answer,
+    )
     from gramps_webapi.api.resources.conversations import (
         add_message,
         auto_title,
@@ -675,38 +680,48 @@ def process_chat(
         history = get_conversation_history(conversation_id)
     elif conversation_id is None:
         # Create a new conversation
-        conv = create_conversation(
+        conversation_id = create_conversation(
             user_id=user_id,
             tree=tree,
             title=auto_title(query),
         )
-        conversation_id = conv.id
         cleanup_old_conversations(user_id, tree)
 
     # Save the user message
     if conversation_id:
         add_message(conversation_id, role="user", content=query)
 
-    try:
-        response = answer_with_agent(
-            prompt=query,
-            tree=tree,
-            include_private=include_private,
-            user_id=user_id,
-            history=history,
-        )
-    except Exception as e:
-        # Log the error
-        from .util import get_logger
-        logger = get_logger()
-        logger.error(f"Error in answer_with_agent: {str(e)}", exc_info=True)
-        # Re-raise with more context
-        raise RuntimeError(f"AI agent error: {str(e)}") from e
-
-    # Extract text from Gemini response
-    response_text = extract_text_from_response(response)
-
-    response_text = sanitize_answer(response_text)
+    # Answers to the first question of a conversation can be reused
+    answer_cache_key = None
+    if not history:
+        answer_cache_key = get_answer_cache_key(tree, include_private, query)
+    response = None
+    response_text = get_cached_answer(answer_cache_key)
+
+    if response_text is None:
+        try:
+            response = answer_with_agent(
+                prompt=query,
+                tree=tree,
+                include_private=include_private,
+                user_id=user_id,
+                history=history,
+            )
+        except Exception as e:
+            # Log the error
+            from .util import get_logger
+            logger = get_logger()
+            logger.error(f"Error in answer_with_agent: {str(e)}", exc_info=True)
+            # Re-raise with more context
+            raise RuntimeError(f"AI agent error: {str(e)}") from e
+
+        # Extract text from Gemini response
+        response_text = extract_text_from_response(response)
+
+        response_text = sanitize_answer(response_text)
+
+        if response_text and response_text.strip():
+            cache_answer(answer_cache_key, response_text)
 
     # If no response text was generated, provide a helpful error
     if not response_text or not response_text.strip():
@@ -721,7 +736,7 @@ def process_chat(
 
     # Save the assistant message
     metadata = None
-    if verbose:
+    if verbose and response is not None:
         metadata = extract_metadata_from_result(response)
 
     if conversation_id:
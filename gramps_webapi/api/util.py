@@ -78,7 +78,13 @@ from webargs.flaskparser import FlaskParser
 from werkzeug.exceptions import HTTPException
 from werkzeug.security import safe_join
 
-from ..auth import config_get, get_tree, get_tree_usage, set_tree_usage
+from ..auth import (
+    add_tree_usage_ai,
+    config_get,
+    get_tree,
+    get_tree_usage,
+    set_tree_usage,
+)
 from ..auth.const import PERM_VIEW_PRIVATE
 from ..const import (
     DB_CONFIG_ALLOWED_KEYS,
@@ -702,14 +708,7 @@ def update_usage_ai(new: int, tree: str | None = None) -> int:
     """Update the usage of AI by adding `new` units to the usage."""
     if not tree:
         tree = get_tree_from_jwt_or_fail()
-    usage_dict = get_tree_usage(tree)
-    if not usage_dict:
-        old_usage = 0
-    else:
-        old_usage = usage_dict.get("usage_ai") or 0
-    new_usage = old_usage + new
-    set_tree_usage(tree, usage_ai=new_usage)
-    return new_usage
+    return add_tree_usage_ai(tree, new)
 
 
 def check_quota_ai(requested: int, tree: str | None = None) -> None:
@@ -21,6 +21,7 @@
 
 import logging
 import os
+import threading
 import warnings
 from typing import Any, Dict, Optional
 
@@ -81,6 +82,21 @@ def deprecated_config_from_env(app):
     return app
 
 
+def _warm_up_llm(api_key: Optional[str], service_tier: Optional[str]) -> None:
+    """Load the AI dependencies and create the Gemini client."""
+    logger = logging.getLogger(__name__)
+    try:
+        # import here to avoid error if AI dependencies are not installed
+        from .api.llm import warm_up
+    except ImportError:
+        logger.warning("LLM_MODEL is set, but the AI dependencies are not installed")
+        return
+    try:
+        warm_up(api_key, service_tier)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Error while warming up the AI dependencies")
+
+
 def create_app(config: Optional[Dict[str, Any]] = None, config_from_env: bool = True):
     """Flask application factory."""
     app = Flask(__name__)
@@ -249,6 +265,33 @@ def create_app(config: Optional[Dict[str, Any]] = None, config_from_env: bool =
             app.config["VECTOR_EMBEDDING_MODEL"]
         )
 
+    if app.config.get("LLM_MODEL") and not app.config.get("TESTING"):
+        # import and initialize the AI dependencies in the background, so the
+        # first AI request doesn't have to wait for them. This is started on
+        # the first request rather than here, so that it runs in the serving
+        # process: a thread started before gunicorn forks its workers (with
+        # --preload) could hold the import lock during the fork.
+        warm_up_lock = threading.Lock()
+        warm_up_started = False
+
+        @app.before_request
+        def start_llm_warm_up():
+            nonlocal warm_up_started
+            if warm_up_started:
+                return
+            with warm_up_lock:
+                if warm_up_started:
+                    return
+                warm_up_started = True
+            api_key = os.environ.get("GEMINI_API_KEY") or app.config.get(
+                "GEMINI_API_KEY"
+            )
+            threading.Thread(
+                target=_warm_up_llm,
+                args=(api_key, app.config.get("LLM_SERVICE_TIER")),
+                daemon=True,
+            ).start()
+
     @app.route("/ready", methods=["GET"])
     def ready():
         return {"status": "ready"}, 200
@@ -28,6 +28,8 @@ from typing import Any, Dict, List, Optional, Sequence, Set, Union
 import sqlalchemy as sa
 from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError, StatementError
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.sql.functions import coalesce
@@ -380,18 +382,18 @@ def config_delete(key: str) -> None:
 
 def get_tree_usage(tree: str) -> Optional[dict[str, int]]:
     """Get tree usage info."""
-    query = user_db.session.query(Tree)  # pylint: disable=no-member
-    tree_obj: Tree = query.filter_by(id=tree).scalar()
-    if tree_obj is None:
+    statement = sa.select(
+        Tree.quota_media,
+        Tree.quota_people,
+        Tree.quota_ai,
+        Tree.usage_media,
+        Tree.usage_people,
+        Tree.usage_ai,
+    ).where(Tree.id == tree)
+    row = user_db.session.execute(statement).first()  # pylint: disable=no-member
+    if row is None:
         return None
-    return {
-        "quota_media": tree_obj.quota_media,
-        "quota_people": tree_obj.quota_people,
-        "quota_ai": tree_obj.quota_ai,
-        "usage_media": tree_obj.usage_media,
-        "usage_people": tree_obj.usage_people,
-        "usage_ai": tree_obj.usage_ai,
-    }
+    return dict(row._mapping)
 
 
 def get_tree_permissions(tree: str) -> Optional[dict[str, int]]:
@@ -426,6 +428,84 @@ def set_tree_usage(
     user_db.session.commit()  # pylint: disable=no-member
 
 
+def add_tree_usage_ai(tree: str, new: int) -> int:
+    """Add `new` units to the AI usage of a tree and return the new usage.
+
+    On PostgreSQL and SQLite, this is a single atomic upsert, so concurrent
+    requests can't overwrite each other's updates.
+    """
+    dialect = user_db.engine.dialect.name
+    usage = {"id": tree, "usage_ai": new}
+    set_usage = {"usage_ai": coalesce(Tree.usage_ai, 0) + new}
+    statement: sa.Insert
+    if dialect == "postgresql":
+        statement = (
+            postgresql_insert(Tree)
+            .values(**usage)
+            .on_conflict_do_update(index_elements=[Tree.id], set_=set_usage)
+        )
+    elif dialect == "sqlite":
+        statement = (
+            sqlite_insert(Tree)
+            .values(**usage)
+            .on_conflict_do_update(index_elements=[Tree.id], set_=set_usage)
+        )
+    else:
+        return _increment_tree_usage_ai(tree, new)
+    session = user_db.session  # pylint: disable=no-member
+    new_usage = session.execute(statement.returning(Tree.usage_ai)).scalar_one()
+    session.commit()
+    return new_usage
+
+
+def _increment_tree_usage_ai(tree: str, new: int) -> int:
+    """Increment the AI usage of a tree without a dialect-specific upsert.
+
+    The counter is incremented server-side with an UPDATE; the row is only
+    inserted if it doesn't exist yet. If a concurrent request inserted it
+    first, the UPDATE is run once more.
+    """
+    session = user_db.session  # pylint: disable=no-member
+    new_usage = _update_tree_usage_ai(tree, new)
+    if new_usage is None:
+        session.add(Tree(id=tree, usage_ai=new))
+        try:
+            session.commit()
+            return new
+        except IntegrityError:
+            session.rollback()
+            new_usage = _update_tree_usage_ai(tree, new)
+            if new_usage is None:
+                raise
+    session.commit()
+    return new_usage
+
+
+def _update_tree_usage_ai(tree: str, new: int) -> Optional[int]:
+    """Increment the AI usage of an existing tree row, without committing.
+
+    Returns the new usage, or None if the tree has no row yet. The new value
+    is read in the same statement (UPDATE ... RETURNING) or, where the
+    dialect doesn't support that, from the row locked before the UPDATE, so
+    a concurrent increment can't be reported as this one's total.
+    """
+    session = user_db.session  # pylint: disable=no-member
+    update = (
+        sa.update(Tree)
+        .where(Tree.id == tree)
+        .values(usage_ai=coalesce(Tree.usage_ai, 0) + new)
+    )
+    if user_db.engine.dialect.update_returning:
+        return session.execute(update.returning(Tree.usage_ai)).scalar_one_or_none()
+    old_usage = session.execute(
+        sa.select(coalesce(Tree.usage_ai, 0)).where(Tree.id == tree).with_for_update()
+    ).scalar_one_or_none()
+    if old_usage is None:
+        return None
+    session.execute(update)
+    return old_usage + new
+
+
 def set_tree_details(
     tree: str,
     quota_media: Optional[int] = None,
@@ -695,11 +775,18 @@ class ThisDayCache(user_db.Model):  # type: ignore
     id = mapped_column(sa.String(36), primary_key=True)
     tree = mapped_column(sa.String, nullable=False)
     month_day = mapped_column(sa.String(5), nullable=False)  # e.g., "02-14"
+    include_private = mapped_column(
+        sa.Boolean, nullable=False, server_default=sa.false()
+    )
+    # last change timestamp of the tree when the digest was generated
+    tree_revision = mapped_column(sa.Float(precision=53), nullable=True)
     content = mapped_column(sa.Text, nullable=False)  # JSON with events and narrative
     created_at = mapped_column(
         sa.DateTime, nullable=False, server_default=sa.func.now()
     )
 
     __table_args__ = (
-        sa.Index("idx_this_day_tree_month_day", "tree", "month_day"),
+        sa.Index(
+            "idx_this_day_tree_month_day", "tree", "month_day", "include_private"
+        ),
     )
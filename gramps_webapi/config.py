@@ -77,6 +77,14 @@ class DefaultConfig(object):
     LLM_MODEL = ""
     LLM_MAX_CONTEXT_LENGTH = 50000
     LLM_SYSTEM_PROMPT = None
+    LLM_CONTEXT_CACHE_TTL = 0
+    LLM_ANSWER_CACHE_TIMEOUT = 0
+    LLM_TOOL_RESULT_CACHE_TIMEOUT = 3600
+    # "on" keeps Google Search enabled for every chat, "auto" only for
+    # questions that need web context, "off" never
+    LLM_SEARCH_GROUNDING = "on"
+    LLM_SERVICE_TIER = None
+    LLM_MAX_ITERATIONS = 10
     VECTOR_EMBEDDING_MODEL = ""
     DISABLE_TELEMETRY = False
     OIDC_ISSUER = ""
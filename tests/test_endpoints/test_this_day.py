@@ -0,0 +1,105 @@
+#
+# Gramps Web API - A RESTful API for the Gramps genealogy program
+#
+# Copyright (C) 2026      Jer Olson
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Test the This Day endpoint cache."""
+
+import unittest
+from unittest.mock import patch
+
+from gramps_webapi.auth import ThisDayCache, user_db
+from gramps_webapi.auth.const import ROLE_GUEST, ROLE_OWNER
+
+from . import BASE_URL, get_test_client
+from .util import fetch_header
+
+TEST_URL = BASE_URL + "/this-day/"
+
+
+def _fake_generate_this_day(month, day, tree, include_private, user_id):
+    """Return a digest revealing whether private data was included."""
+    return ("private digest" if include_private else "public digest"), {}
+
+
+@patch(
+    "gramps_webapi.api.resources.this_day.get_db_last_change_timestamp",
+    return_value=1.0,
+)
+@patch(
+    "gramps_webapi.api.llm.generate_this_day", side_effect=_fake_generate_this_day
+)
+class TestThisDayCache(unittest.TestCase):
+    """Test that cached digests respect privacy and the tree revision."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = get_test_client()
+
+    def setUp(self):
+        with self.client.application.app_context():
+            ThisDayCache.query.delete()
+            user_db.session.commit()
+        self.header_private = fetch_header(self.client, role=ROLE_OWNER)
+        self.header_public = fetch_header(self.client, role=ROLE_GUEST)
+
+    def _get(self, header):
+        rv = self.client.get(TEST_URL + "?date=03-15", headers=header)
+        self.assertEqual(rv.status_code, 200)
+        return rv.json
+
+    def test_private_and_public_not_shared(self, mock_generate, mock_timestamp):
+        data = self._get(self.header_private)
+        self.assertEqual(data["content"], "private digest")
+        self.assertFalse(data["cached"])
+        # a public request must not get the private digest
+        data = self._get(self.header_public)
+        self.assertEqual(data["content"], "public digest")
+        self.assertFalse(data["cached"])
+        self.assertEqual(mock_generate.call_count, 2)
+        # both are cached separately
+        data = self._get(self.header_private)
+        self.assertEqual(data["content"], "private digest")
+        self.assertTrue(data["cached"])
+        data = self._get(self.header_public)
+        self.assertEqual(data["content"], "public digest")
+        self.assertTrue(data["cached"])
+        self.assertEqual(mock_generate.call_count, 2)
+
+    def test_public_first_not_served_to_private(self, mock_generate, mock_timestamp):
+        data = self._get(self.header_public)
+        self.assertEqual(data["content"], "public digest")
+        data = self._get(self.header_private)
+        self.assertEqual(data["content"], "private digest")
+        self.assertFalse(data["cached"])
+
+    def test_stale_revision_replaced(self, mock_generate, mock_timestamp):
+        # realistic modification times need double precision to compare equal
+        mock_timestamp.return_value = 1760621234.123456
+        self._get(self.header_private)
+        self.assertTrue(self._get(self.header_private)["cached"])
+        mock_timestamp.return_value = 1760621299.654321
+        data = self._get(self.header_private)
+        self.assertFalse(data["cached"])
+        self.assertEqual(mock_generate.call_count, 2)
+        with self.client.application.app_context():
+            rows = ThisDayCache.query.filter_by(
+                month_day="03-15", include_private=True
+            ).all()
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(rows[0].tree_revision, 1760621299.654321)
+        self.assertTrue(self._get(self.header_private)["cached"])
@@ -0,0 +1,385 @@
+#
+# Gramps Web API - A RESTful API for the Gramps genealogy program
+#
+# Copyright (C) 2025      David Straub
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Tests for the Gemini agent loop helpers."""
+
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from google.genai import types
+
+from gramps_webapi.api.llm import agent
+from gramps_webapi.api.llm.agent import (
+    _FORCED_SYNTHESIS_CONTENT,
+    _elide_tool_results,
+    _execute_tool_calls,
+    _get_context_cache_name,
+    _get_service_tier,
+    run_agent,
+)
+from gramps_webapi.api.llm.deps import AgentDeps
+
+
+DEPS = AgentDeps(
+    tree="tree",
+    include_private=True,
+    max_context_length=50000,
+    user_id="test_user",
+)
+
+
+class TestExecuteToolCalls(unittest.TestCase):
+    """Tests for executing the tool calls of one model turn."""
+
+    def setUp(self):
+        self.threads = []
+
+        def fake_execute(tool_name, tool_args, deps):
+            self.threads.append(threading.get_ident())
+            return f"{tool_name}:{tool_args.get('category', '')}"
+
+        patcher = patch(
+            "gramps_webapi.api.llm.agent.execute_tool_call", side_effect=fake_execute
+        )
+        self.mock_execute = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_results_keep_call_order(self):
+        calls = [
+            ("get_tree_statistics", {}),
+            ("find_coincidences_and_clusters", {"category": "name_reuse"}),
+            ("analyze_migration_patterns", {}),
+        ]
+        results = _execute_tool_calls(calls, DEPS)
+        self.assertEqual(
+            results,
+            [
+                "get_tree_statistics:",
+                "find_coincidences_and_clusters:name_reuse",
+                "analyze_migration_patterns:",
+            ],
+        )
+
+    @patch("gramps_webapi.api.llm.agent._TOOL_CALL_TIMEOUT", 0.1)
+    def test_single_call_times_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def fake_execute(tool_name, tool_args, deps):
+            self.threads.append(threading.get_ident())
+            release.wait(5)
+            return tool_name
+
+        self.mock_execute.side_effect = fake_execute
+        results = _execute_tool_calls([("get_tree_statistics", {})], DEPS)
+        self.assertTrue(results[0].startswith("Error: get_tree_statistics timed out"))
+        self.assertNotIn(threading.get_ident(), self.threads)
+
+    def test_write_tools_run_sequentially(self):
+        calls = [
+            ("get_person_full_details", {}),
+            ("update_person_field", {}),
+        ]
+        _execute_tool_calls(calls, DEPS)
+        self.assertEqual(self.threads, [threading.get_ident()] * 2)
+
+    def test_duplicate_calls_run_once(self):
+        calls = [
+            ("find_coincidences_and_clusters", {"category": "name_reuse"}),
+            ("get_tree_statistics", {}),
+            ("find_coincidences_and_clusters", {"category": "name_reuse"}),
+        ]
+        results = _execute_tool_calls(calls, DEPS)
+        self.assertEqual(self.mock_execute.call_count, 2)
+        self.assertEqual(
+            results,
+            [
+                "find_coincidences_and_clusters:name_reuse",
+                "get_tree_statistics:",
+                "find_coincidences_and_clusters:name_reuse",
+            ],
+        )
+
+    def test_cache_reused_within_run(self):
+        cache = {}
+        calls = [("search_genealogy_database", {"query": "farmers"})]
+        _execute_tool_calls(calls, DEPS, cache=cache)
+        _execute_tool_calls(calls, DEPS, cache=cache)
+        self.assertEqual(self.mock_execute.call_count, 1)
+        _execute_tool_calls([("update_person_field", {})], DEPS, cache=cache)
+        self.assertEqual(cache, {})
+        _execute_tool_calls(calls, DEPS, cache=cache)
+        self.assertEqual(self.mock_execute.call_count, 3)
+
+    @patch("gramps_webapi.api.llm.agent._TOOL_CALL_TIMEOUT", 0.1)
+    def test_slow_calls_time_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def fake_execute(tool_name, tool_args, deps):
+            if tool_name == "find_coincidences_and_clusters":
+                release.wait(5)
+            return tool_name
+
+        self.mock_execute.side_effect = fake_execute
+        calls = [
+            ("get_tree_statistics", {}),
+            ("find_coincidences_and_clusters", {}),
+        ]
+        results = _execute_tool_calls(calls, DEPS)
+        self.assertEqual(results[0], "get_tree_statistics")
+        self.assertTrue(results[1].startswith("Error: find_coincidences_and_clusters"))
+
+    def test_calls_wait_for_a_free_worker(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def fake_execute(tool_name, tool_args, deps):
+            if tool_name == "find_coincidences_and_clusters":
+                release.wait(5)
+            return tool_name
+
+        self.mock_execute.side_effect = fake_execute
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        with patch("gramps_webapi.api.llm.agent._TOOL_EXECUTOR", executor):
+            # the second call waits for the first one's worker
+            results = _execute_tool_calls(
+                [("get_tree_statistics", {}), ("get_current_date", {})], DEPS
+            )
+            self.assertEqual(results, ["get_tree_statistics", "get_current_date"])
+            with patch("gramps_webapi.api.llm.agent._TOOL_CALL_TIMEOUT", 0.1):
+                results = _execute_tool_calls(
+                    [("find_coincidences_and_clusters", {}), ("get_current_date", {})],
+                    DEPS,
+                )
+                self.assertTrue(
+                    results[0].startswith("Error: find_coincidences_and_clusters")
+                )
+                # never got the worker, which the first call still occupies
+                self.assertTrue(results[1].startswith("Error: get_current_date"))
+            release.set()
+            results = _execute_tool_calls([("analyze_migration_patterns", {})], DEPS)
+            self.assertEqual(results, ["analyze_migration_patterns"])
+
+
+class TestElideToolResults(unittest.TestCase):
+    """Tests for eliding tool results of earlier turns."""
+
+    def test_long_results_elided(self):
+        content = types.Content(
+            role="user",
+            parts=[
+                types.Part.from_function_response(
+                    name="get_tree_statistics", response={"result": "x" * 5000}
+                ),
+                types.Part.from_function_response(
+                    name="get_current_date", response={"result": "2025-01-01"}
+                ),
+            ],
+        )
+        elided = _elide_tool_results(content)
+        self.assertEqual(
+            elided.parts[0].function_response.response["result"],
+            "<get_tree_statistics result elided, 5000 characters>",
+        )
+        self.assertEqual(
+            elided.parts[1].function_response.response["result"], "2025-01-01"
+        )
+        # the original turn is left unchanged
+        self.assertEqual(
+            content.parts[0].function_response.response["result"], "x" * 5000
+        )
+
+
+class TestServiceTier(unittest.TestCase):
+    """Tests for validating the configured service tier."""
+
+    def setUp(self):
+        _get_service_tier.cache_clear()
+        self.addCleanup(_get_service_tier.cache_clear)
+
+    def test_supported(self):
+        self.assertIsNone(_get_service_tier(None))
+        self.assertEqual(_get_service_tier("priority"), "priority")
+
+    def test_unsupported_ignored(self):
+        with patch(
+            "gramps_webapi.api.llm.agent.types.GenerateContentConfig",
+            side_effect=ValueError("Extra inputs are not permitted"),
+        ) as mock_config, patch("gramps_webapi.api.llm.agent.get_logger") as mock_logger:
+            self.assertIsNone(_get_service_tier("priority"))
+            self.assertIsNone(_get_service_tier("priority"))
+        # checked and logged only once
+        self.assertEqual(mock_config.call_count, 1)
+        self.assertEqual(mock_logger.return_value.error.call_count, 1)
+
+
+class TestContextCacheName(unittest.TestCase):
+    """Tests for creating and reusing Gemini context caches."""
+
+    def setUp(self):
+        agent._CONTEXT_CACHES.clear()
+        self.addCleanup(agent._CONTEXT_CACHES.clear)
+
+    def _client(self, name):
+        client = MagicMock()
+
+        def create(**kwargs):
+            # the network call must not block requests using other caches
+            self.assertFalse(agent._CONTEXT_CACHES_LOCK.locked())
+            cache = MagicMock()
+            cache.name = name
+            return cache
+
+        client.caches.create.side_effect = create
+        return client
+
+    def test_cache_reused_per_client(self):
+        client = self._client("cache-a")
+        for _ in range(2):
+            name = _get_context_cache_name(client, "model", "prompt", True, 3600)
+            self.assertEqual(name, "cache-a")
+        self.assertEqual(client.caches.create.call_count, 1)
+
+    def test_cache_not_shared_between_clients(self):
+        client_a = self._client("cache-a")
+        client_b = self._client("cache-b")
+        name_a = _get_context_cache_name(client_a, "model", "prompt", True, 3600)
+        name_b = _get_context_cache_name(client_b, "model", "prompt", True, 3600)
+        self.assertEqual((name_a, name_b), ("cache-a", "cache-b"))
+
+
+def _function_call_response(name, args):
+    """Return a model response requesting a single tool call."""
+    part = types.Part(function_call=types.FunctionCall(name=name, args=args))
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))]
+    )
+
+
+def _text_response(text):
+    """Return a model response with a final text answer."""
+    return types.GenerateContentResponse(
+        candidates=[
+            types.Candidate(
+                content=types.Content(
+                    role="model", parts=[types.Part.from_text(text=text)]
+                )
+            )
+        ]
+    )
+
+
+def _function_calling_disabled(config):
+    """Whether a generation config disables function calling."""
+    return (
+        config.tool_config is not None
+        and config.tool_config.function_calling_config.mode
+        == types.FunctionCallingConfigMode.NONE
+    )
+
+
+@patch.dict("os.environ", {"GEMINI_API_KEY": "test-key"})
+class TestRunAgent(unittest.TestCase):
+    """Tests for the agent loop with a mocked Gemini client."""
+
+    def setUp(self):
+        self.requests = []
+        self.responses = []
+        client = MagicMock()
+
+        def generate_content(model, contents, config):
+            # contents is extended in place later on, so keep a copy
+            self.requests.append((list(contents), config))
+            return self.responses.pop(0)
+
+        client.models.generate_content.side_effect = generate_content
+        patcher = patch("gramps_webapi.api.llm.agent._get_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch(
+            "gramps_webapi.api.llm.agent.execute_tool_call", return_value="result"
+        )
+        self.mock_execute = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_answer_forced_on_last_iteration(self):
+        self.responses = [
+            _function_call_response("filter_people", {"surname": "Smith"}),
+            _function_call_response("filter_people", {"surname": "Jones"}),
+            _text_response("The answer"),
+        ]
+        response = run_agent("Who?", DEPS, "model", max_iterations=3)
+        self.assertEqual(response.text, "The answer")
+        self.assertEqual(len(self.requests), 3)
+        self.assertFalse(_function_calling_disabled(self.requests[1][1]))
+        contents, config = self.requests[2]
+        self.assertTrue(_function_calling_disabled(config))
+        self.assertIs(contents[-1], _FORCED_SYNTHESIS_CONTENT)
+
+    def test_repeated_tool_calls_force_answer(self):
+        self.responses = [
+            _function_call_response("get_tree_statistics", {}) for _ in range(3)
+        ] + [_text_response("The answer")]
+        response = run_agent("Stats?", DEPS, "model", max_iterations=10)
+        self.assertEqual(response.text, "The answer")
+        # the third identical turn triggers the forced answer
+        self.assertEqual(len(self.requests), 4)
+        contents, config = self.requests[3]
+        self.assertTrue(_function_calling_disabled(config))
+        self.assertIs(contents[-1], _FORCED_SYNTHESIS_CONTENT)
+        # identical calls are answered from the per-run cache
+        self.assertEqual(self.mock_execute.call_count, 1)
+
+    @patch(
+        "gramps_webapi.api.llm.agent._get_context_cache_name",
+        return_value="cachedContents/test",
+    )
+    def test_tool_call_after_loop_with_context_cache(self, mock_cache_name):
+        # with a context cache, function calling can't be disabled, so the
+        # model may still call tools on the final turn
+        self.responses = [
+            _function_call_response("filter_people", {"surname": "Smith"}),
+            _function_call_response("filter_people", {"surname": "Jones"}),
+            _text_response("The answer"),
+        ]
+        response = run_agent(
+            "Who?", DEPS, "model", context_cache_ttl=3600, max_iterations=2
+        )
+        self.assertEqual(response.text, "The answer")
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(self.mock_execute.call_count, 2)
+        contents, config = self.requests[2]
+        self.assertEqual(config.cached_content, "cachedContents/test")
+        self.assertIs(contents[-1], _FORCED_SYNTHESIS_CONTENT)
+        self.assertIsNotNone(contents[-2].parts[0].function_response)
+
+    def test_single_iteration_never_offers_tools(self):
+        self.responses = [_text_response("The answer")]
+        response = run_agent("Who?", DEPS, "model", max_iterations=1)
+        self.assertEqual(response.text, "The answer")
+        self.assertEqual(len(self.requests), 1)
+        contents, config = self.requests[0]
+        self.assertTrue(_function_calling_disabled(config))
+        # nothing to synthesize from, so only the prompt is sent
+        self.assertEqual(len(contents), 1)
+        self.mock_execute.assert_not_called()
@@ -0,0 +1,95 @@
+"""Test the AI chat answer cache."""
+
+#
+# Gramps Web API - A RESTful API for the Gramps genealogy program
+#
+# Copyright (C) 2025      David Straub
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+import unittest
+from unittest.mock import patch
+
+from gramps_webapi.api.llm.answer_cache import (
+    cache_answer,
+    get_answer_cache_key,
+    get_cached_answer,
+    normalize_query,
+)
+from gramps_webapi.app import create_app
+from gramps_webapi.const import ENV_CONFIG_FILE, TEST_AUTH_CONFIG
+
+
+class TestNormalizeQuery(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(
+            normalize_query("  Who are   the parents of I0044? "),
+            "who are the parents of i0044",
+        )
+        self.assertEqual(normalize_query("Surprise me!!"), "surprise me")
+        self.assertEqual(normalize_query("Surprise me"), "surprise me")
+
+
+class TestAnswerCache(unittest.TestCase):
+    def _make_app(self, timeout):
+        with patch.dict("os.environ", {ENV_CONFIG_FILE: TEST_AUTH_CONFIG}):
+            return create_app(
+                config={
+                    "TESTING": True,
+                    "RATELIMIT_ENABLED": False,
+                    "LLM_MODEL": "mock-model",
+                    "LLM_ANSWER_CACHE_TIMEOUT": timeout,
+                },
+                config_from_env=False,
+            )
+
+    def test_disabled(self):
+        app = self._make_app(timeout=0)
+        with app.app_context():
+            self.assertIsNone(get_answer_cache_key("tree", False, "Surprise me"))
+            self.assertIsNone(get_cached_answer(None))
+
+    @patch("gramps_webapi.api.llm.answer_cache.get_db_last_change_timestamp")
+    def test_key(self, mock_timestamp):
+        app = self._make_app(timeout=60)
+        with app.app_context():
+            mock_timestamp.return_value = 1.0
+            key = get_answer_cache_key("tree", False, "Surprise me?")
+            self.assertIsNotNone(key)
+            self.assertEqual(key, get_answer_cache_key("tree", False, "surprise  me"))
+            self.assertNotEqual(key, get_answer_cache_key("tree", True, "surprise me"))
+            self.assertNotEqual(key, get_answer_cache_key("other", False, "surprise me"))
+            # answers depend on the agent settings
+            with patch.dict(app.config, {"LLM_SEARCH_GROUNDING": "off"}):
+                self.assertNotEqual(
+                    key, get_answer_cache_key("tree", False, "surprise me")
+                )
+            with patch.dict(app.config, {"LLM_MAX_ITERATIONS": 3}):
+                self.assertNotEqual(
+                    key, get_answer_cache_key("tree", False, "surprise me")
+                )
+            mock_timestamp.return_value = 2.0
+            self.assertNotEqual(key, get_answer_cache_key("tree", False, "surprise me"))
+            mock_timestamp.return_value = None
+            self.assertIsNone(get_answer_cache_key("tree", False, "surprise me"))
+
+    @patch("gramps_webapi.api.llm.answer_cache.get_db_last_change_timestamp")
+    def test_roundtrip(self, mock_timestamp):
+        app = self._make_app(timeout=60)
+        with app.app_context():
+            mock_timestamp.return_value = 1.0
+            key = get_answer_cache_key("tree", False, "Who was the oldest person?")
+            cache_answer(key, "An answer")
+            self.assertEqual(get_cached_answer(key), "An answer")
@@ -0,0 +1,65 @@
+#
+# Gramps Web API - A RESTful API for the Gramps genealogy program
+#
+# Copyright (C) 2025      David Straub
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+"""Tests for the Google Search grounding policy."""
+
+import unittest
+
+from gramps_webapi.api.llm.grounding_policy import (
+    DEFAULT_SEARCH_GROUNDING_MODE,
+    decide_chat_grounding,
+    normalize_search_grounding_mode,
+)
+from gramps_webapi.config import DefaultConfig
+
+
+class TestNormalizeSearchGroundingMode(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(normalize_search_grounding_mode("off"), "off")
+        self.assertEqual(normalize_search_grounding_mode(" ON "), "on")
+        self.assertEqual(normalize_search_grounding_mode("auto"), "auto")
+        self.assertEqual(normalize_search_grounding_mode("sometimes"), "on")
+        self.assertEqual(normalize_search_grounding_mode(None), "on")
+
+    def test_default_keeps_search_enabled(self):
+        # existing deployments keep grounding every chat unless they opt in
+        self.assertEqual(DefaultConfig.LLM_SEARCH_GROUNDING, "on")
+        self.assertEqual(DEFAULT_SEARCH_GROUNDING_MODE, "on")
+        decision = decide_chat_grounding(
+            DefaultConfig.LLM_SEARCH_GROUNDING, "Who are the parents of Edward Smith?"
+        )
+        self.assertTrue(decision["use_search"])
+
+
+class TestDecideChatGrounding(unittest.TestCase):
+    def test_auto(self):
+        decision = decide_chat_grounding("auto", "What was life like in 1880s Oslo?")
+        self.assertTrue(decision["use_search"])
+        decision = decide_chat_grounding("auto", "Why did they emigrate?")
+        self.assertTrue(decision["use_search"])
+        decision = decide_chat_grounding("auto", "Who are the parents of Edward Smith?")
+        self.assertFalse(decision["use_search"])
+        self.assertEqual(decision["mode"], "auto")
+
+    def test_on_off(self):
+        self.assertTrue(decide_chat_grounding("on", "Who is I0044?")["use_search"])
+        self.assertFalse(
+            decide_chat_grounding("off", "Tell me about the war")["use_search"]
+        )
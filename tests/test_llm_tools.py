@@ -20,18 +20,28 @@
 """Tests for LLM tools."""
 
 import os
+import tempfile
 import unittest
+import uuid
 from unittest.mock import MagicMock, patch
 
 from gramps_webapi.api.llm.tools import (
+    _RELATIONSHIP_PREFIX_CACHE,
+    _TOOL_RESULT_CACHE,
+    _RelationshipDbProxy,
+    _get_cached_relationship_prefix,
+    _get_relationship_prefix,
     add_event_to_person,
+    cache_tool_result,
     filter_events,
     filter_people,
     _build_date_expression,
     get_data_quality_issues,
+    persist_tool_result,
     update_person_field,
 )
 from gramps_webapi.api.llm.deps import AgentDeps
+from gramps_webapi.api.resources.util import get_one_relationship
 from gramps_webapi.api.search import get_search_indexer
 from gramps_webapi.app import create_app
 from gramps_webapi.auth import add_user, user_db
@@ -1056,5 +1066,307 @@ class TestAddEventToPersonTool(unittest.TestCase):
         self.assertTrue(tx_message.startswith("AI:"))
 
 
+class TestToolResultCache(unittest.TestCase):
+    """Tests for the cache_tool_result decorator."""
+
+    def setUp(self):
+        _TOOL_RESULT_CACHE.clear()
+        self.ctx = MagicMock()
+        self.ctx.deps = AgentDeps(
+            tree="tree",
+            include_private=True,
+            max_context_length=50000,
+            user_id="test_user",
+        )
+        self.calls = []
+
+        @cache_tool_result
+        def tool(ctx, category="all"):
+            self.calls.append(category)
+            return f"result for {category}"
+
+        self.tool = tool
+
+    def tearDown(self):
+        _TOOL_RESULT_CACHE.clear()
+
+    @patch("gramps_webapi.api.llm.tools.get_db_last_change_timestamp")
+    def test_reuses_result_for_unchanged_tree(self, mock_timestamp):
+        mock_timestamp.return_value = 1.0
+        self.assertEqual(self.tool(self.ctx, category="all"), "result for all")
+        self.assertEqual(self.tool(self.ctx, category="all"), "result for all")
+        self.assertEqual(self.calls, ["all"])
+        self.tool(self.ctx, category="name_reuse")
+        self.assertEqual(self.calls, ["all", "name_reuse"])
+
+    @patch("gramps_webapi.api.llm.tools.get_db_last_change_timestamp")
+    def test_tree_change_invalidates(self, mock_timestamp):
+        mock_timestamp.return_value = 1.0
+        self.tool(self.ctx)
+        mock_timestamp.return_value = 2.0
+        self.tool(self.ctx)
+        self.assertEqual(self.calls, ["all", "all"])
+
+    @patch("gramps_webapi.api.llm.tools.get_db_last_change_timestamp")
+    def test_privacy_is_part_of_key(self, mock_timestamp):
+        mock_timestamp.return_value = 1.0
+        self.tool(self.ctx)
+        self.ctx.deps.include_private = False
+        self.tool(self.ctx)
+        self.assertEqual(self.calls, ["all", "all"])
+
+    @patch("gramps_webapi.api.llm.tools.get_db_last_change_timestamp")
+    def test_unknown_revision_not_cached(self, mock_timestamp):
+        mock_timestamp.return_value = None
+        self.tool(self.ctx)
+        self.tool(self.ctx)
+        self.assertEqual(self.calls, ["all", "all"])
+
+    @patch("gramps_webapi.api.cache.get_db_manager")
+    def test_tree_without_metadata_file_not_cached(self, mock_db_manager):
+        # e.g. a PostgreSQL tree, whose directory has no meta_data.db
+        with tempfile.TemporaryDirectory() as dbdir:
+            mock_db_manager.return_value = MagicMock(dbdir=dbdir, dirname="tree")
+            self.tool(self.ctx)
+            self.tool(self.ctx)
+        self.assertEqual(self.calls, ["all", "all"])
+
+    @patch("gramps_webapi.api.llm.tools._TOOL_RESULT_CACHE_MAX_LENGTH", 10)
+    @patch("gramps_webapi.api.llm.tools.get_db_last_change_timestamp")
+    def test_large_result_not_cached(self, mock_timestamp):
+        mock_timestamp.return_value = 1.0
+        self.tool(self.ctx)
+        self.tool(self.ctx)
+        self.assertEqual(self.calls, ["all", "all"])
+
+
+@patch("gramps_webapi.api.llm.tools.get_one_relationship")
+class TestRelationshipPrefix(unittest.TestCase):
+    """Tests for the progressive relationship search of result prefixes."""
+
+    def setUp(self):
+        self.anchor = MagicMock(gramps_id="I0001")
+        self.person = MagicMock(gramps_id="I0002")
+        self.logger = MagicMock()
+
+    def _depths(self, mock_relationship):
+        return [call.kwargs["depth"] for call in mock_relationship.call_args_list]
+
+    def test_close_relative_found_at_shallow_depth(self, mock_relationship):
+        mock_relationship.return_value = ("father", 1, 0)
+        prefix = _get_relationship_prefix(None, self.anchor, self.person, self.logger)
+        self.assertEqual(prefix, "[father] ")
+        self.assertEqual(self._depths(mock_relationship), [3])
+
+    def test_distant_relative_found_at_full_depth(self, mock_relationship):
+        def relationship(db_handle, person1, person2, depth):
+            if depth < 5:
+                return "", -1, -1
+            return "third cousin", 4, 4
+
+        mock_relationship.side_effect = relationship
+        prefix = _get_relationship_prefix(None, self.anchor, self.person, self.logger)
+        self.assertEqual(prefix, "[third cousin] ")
+        self.assertEqual(self._depths(mock_relationship), [3, 10])
+
+    def test_unrelated(self, mock_relationship):
+        mock_relationship.return_value = ("", -1, -1)
+        prefix = _get_relationship_prefix(None, self.anchor, self.person, self.logger)
+        self.assertEqual(prefix, "")
+        self.assertEqual(self._depths(mock_relationship), [3, 10])
+
+
+@patch("gramps_webapi.api.resources.util.get_relationship_calculator")
+class TestGetOneRelationshipDepth(unittest.TestCase):
+    """Tests for the shallow probe of the shared relationship helper."""
+
+    def _calculator(self, mock_get_calculator, found_at_depth):
+        depths = []
+        calc = mock_get_calculator.return_value
+        calc.set_depth.side_effect = depths.append
+
+        def relationship(*args, **kwargs):
+            if found_at_depth is not None and depths[-1] >= found_at_depth:
+                return "cousin", 3, 3
+            return "", -1, -1
+
+        calc.get_one_relationship.side_effect = relationship
+        return depths
+
+    def test_hit_within_probe_depth(self, mock_get_calculator):
+        depths = self._calculator(mock_get_calculator, found_at_depth=4)
+        result = get_one_relationship(None, None, None, depth=10)
+        self.assertEqual(result, ("cousin", 3, 3))
+        self.assertEqual(depths, [5])
+
+    def test_hit_beyond_probe_depth(self, mock_get_calculator):
+        depths = self._calculator(mock_get_calculator, found_at_depth=8)
+        result = get_one_relationship(None, None, None, depth=10)
+        self.assertEqual(result, ("cousin", 3, 3))
+        self.assertEqual(depths, [5, 10])
+
+    def test_miss(self, mock_get_calculator):
+        depths = self._calculator(mock_get_calculator, found_at_depth=None)
+        result = get_one_relationship(None, None, None, depth=10)
+        self.assertEqual(result, ("", -1, -1))
+        self.assertEqual(depths, [5, 10])
+
+    def test_shallow_request_not_probed(self, mock_get_calculator):
+        depths = self._calculator(mock_get_calculator, found_at_depth=None)
+        get_one_relationship(None, None, None, depth=3)
+        self.assertEqual(depths, [3])
+
+
+class TestRelationshipPrefixCache(unittest.TestCase):
+    """Tests for caching relationship prefixes."""
+
+    def setUp(self):
+        _RELATIONSHIP_PREFIX_CACHE.clear()
+        self.addCleanup(_RELATIONSHIP_PREFIX_CACHE.clear)
+        self.deps = AgentDeps(
+            tree="tree",
+            include_private=True,
+            max_context_length=50000,
+            user_id="test_user",
+        )
+        self.anchor = MagicMock(handle="anchor")
+        self.person = MagicMock(handle="person")
+
+    @patch(
+        "gramps_webapi.api.llm.tools._get_relationship_prefix",
+        return_value="[father] ",
+    )
+    def test_reuses_prefix_for_same_revision(self, mock_prefix):
+        for revision in (1.0, 1.0, 2.0):
+            prefix = _get_cached_relationship_prefix(
+                self.deps, revision, None, self.anchor, self.person, None
+            )
+            self.assertEqual(prefix, "[father] ")
+        self.assertEqual(mock_prefix.call_count, 2)
+
+    @patch(
+        "gramps_webapi.api.llm.tools._get_relationship_prefix",
+        return_value="[father] ",
+    )
+    def test_unknown_revision_not_cached(self, mock_prefix):
+        for _ in range(2):
+            _get_cached_relationship_prefix(
+                self.deps, None, None, self.anchor, self.person, None
+            )
+        self.assertEqual(mock_prefix.call_count, 2)
+
+
+class TestRelationshipDbProxy(unittest.TestCase):
+    """Tests for the proxy used by relationship calculations."""
+
+    def test_objects_loaded_once_on_demand(self):
+        db = MagicMock()
+        proxy = _RelationshipDbProxy(db)
+        db.iter_people.assert_not_called()
+        db.iter_families.assert_not_called()
+        for _ in range(2):
+            proxy.get_person_from_handle("person")
+            proxy.get_family_from_handle("family")
+        db.get_person_from_handle.assert_called_once_with("person")
+        db.get_family_from_handle.assert_called_once_with("family")
+
+
+class TestPersistToolResult(unittest.TestCase):
+    """Tests for the persist_tool_result decorator."""
+
+    def setUp(self):
+        self.ctx = MagicMock()
+        self.ctx.deps = AgentDeps(
+            tree="tree",
+            include_private=True,
+            max_context_length=50000,
+            user_id="test_user",
+        )
+        self.calls = []
+        self.store = {}
+        self.timeouts = []
+
+        def set_(key, value, timeout=None):
+            self.store[key] = value
+            self.timeouts.append(timeout)
+
+        patcher = patch("gramps_webapi.api.llm.tools.request_cache")
+        mock_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        mock_cache.get.side_effect = self.store.get
+        mock_cache.set.side_effect = set_
+
+        app_context = TEST_APP.app_context()
+        app_context.push()
+        self.addCleanup(app_context.pop)
+
+        @persist_tool_result
+        def tool(ctx, category="all"):
+            self.calls.append(category)
+            if category == "bad":
+                return "Error: bad category"
+            return f"result for {category}"
+
+        self.tool = tool
+
+    @patch("gramps_webapi.api.llm.tools.get_db_last_change_timestamp")
+    def test_reuses_stored_result(self, mock_timestamp):
+        mock_timestamp.return_value = 1.0
+        self.assertEqual(self.tool(self.ctx, category="all"), "result for all")
+        self.assertEqual(self.tool(self.ctx, category="all"), "result for all")
+        self.assertEqual(self.calls, ["all"])
+        mock_timestamp.return_value = 2.0
+        self.tool(self.ctx, category="all")
+        self.assertEqual(self.calls, ["all", "all"])
+        # entries expire instead of being kept forever
+        self.assertEqual(self.timeouts, [3600, 3600])
+
+    @patch("gramps_webapi.api.llm.tools.get_db_last_change_timestamp")
+    def test_disabled_without_timeout(self, mock_timestamp):
+        mock_timestamp.return_value = 1.0
+        with patch.dict(TEST_APP.config, {"LLM_TOOL_RESULT_CACHE_TIMEOUT": 0}):
+            self.tool(self.ctx, category="all")
+            self.tool(self.ctx, category="all")
+        self.assertEqual(self.calls, ["all", "all"])
+        self.assertEqual(self.store, {})
+
+    @patch("gramps_webapi.api.llm.tools.get_db_last_change_timestamp")
+    def test_errors_not_stored(self, mock_timestamp):
+        mock_timestamp.return_value = 1.0
+        self.tool(self.ctx, category="bad")
+        self.tool(self.ctx, category="bad")
+        self.assertEqual(self.calls, ["bad", "bad"])
+        self.assertEqual(self.store, {})
+
+
+
+class TestPersistToolResultRequestCache(unittest.TestCase):
+    """Test persist_tool_result with the app's request cache."""
+
+    @patch("gramps_webapi.api.llm.tools.get_db_last_change_timestamp")
+    def test_hit_across_calls_and_miss_after_change(self, mock_timestamp):
+        ctx = MagicMock()
+        ctx.deps = AgentDeps(
+            tree=f"persist-{uuid.uuid4()}",
+            include_private=False,
+            max_context_length=50000,
+            user_id="test_user",
+        )
+        calls = []
+
+        @persist_tool_result
+        def tool(ctx):
+            calls.append(1)
+            return f"result {len(calls)}"
+
+        with TEST_APP.app_context():
+            mock_timestamp.return_value = 1760621234.5
+            self.assertEqual(tool(ctx), "result 1")
+            self.assertEqual(tool(ctx), "result 1")
+            mock_timestamp.return_value = 1760621299.5
+            self.assertEqual(tool(ctx), "result 2")
+            self.assertEqual(tool(ctx), "result 2")
+        self.assertEqual(len(calls), 2)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,90 @@
+#
+# Gramps Web API - A RESTful API for the Gramps genealogy program
+#
+# Copyright (C) 2025      David Straub
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""Tests for incrementing the AI usage of a tree."""
+
+import unittest
+from unittest.mock import patch
+
+from gramps_webapi.app import create_app
+from gramps_webapi.auth import (
+    _increment_tree_usage_ai,
+    _update_tree_usage_ai,
+    add_tree_usage_ai,
+    get_tree_usage,
+    set_tree_details,
+    set_tree_usage,
+    user_db,
+)
+from gramps_webapi.const import ENV_CONFIG_FILE, TEST_EXAMPLE_GRAMPS_AUTH_CONFIG
+
+
+class TestAddTreeUsageAI(unittest.TestCase):
+    """Test the atomic upsert and the fallback for other dialects."""
+
+    @classmethod
+    def setUpClass(cls):
+        with patch.dict("os.environ", {ENV_CONFIG_FILE: TEST_EXAMPLE_GRAMPS_AUTH_CONFIG}):
+            cls.app = create_app(config={"TESTING": True}, config_from_env=False)
+        with cls.app.app_context():
+            user_db.create_all()
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.addCleanup(self.ctx.pop)
+
+    def _check_increment(self, increment, prefix):
+        # first insert creates the row
+        self.assertEqual(increment(f"{prefix}_new", 2), 2)
+        self.assertEqual(get_tree_usage(f"{prefix}_new")["usage_ai"], 2)
+        # existing row with a usage is incremented
+        set_tree_usage(f"{prefix}_existing", usage_ai=5)
+        self.assertEqual(increment(f"{prefix}_existing", 3), 8)
+        self.assertEqual(increment(f"{prefix}_existing", 1), 9)
+        self.assertEqual(get_tree_usage(f"{prefix}_existing")["usage_ai"], 9)
+        # existing row without a usage yet counts from zero
+        set_tree_details(f"{prefix}_no_usage", quota_media=100)
+        self.assertEqual(increment(f"{prefix}_no_usage", 4), 4)
+        usage = get_tree_usage(f"{prefix}_no_usage")
+        self.assertEqual(usage["usage_ai"], 4)
+        self.assertEqual(usage["quota_media"], 100)
+
+    def test_upsert(self):
+        self.assertEqual(user_db.engine.dialect.name, "sqlite")
+        self._check_increment(add_tree_usage_ai, "upsert")
+
+    def test_fallback(self):
+        self._check_increment(_increment_tree_usage_ai, "fallback")
+
+    def test_fallback_without_returning(self):
+        with patch.object(user_db.engine.dialect, "update_returning", False):
+            self._check_increment(_increment_tree_usage_ai, "locked")
+
+    def test_fallback_conflicting_insert(self):
+        set_tree_usage("conflict", usage_ai=5)
+        results = [None]
+
+        def update(tree, new):
+            # the first UPDATE misses a row another request inserts meanwhile
+            return results.pop() if results else _update_tree_usage_ai(tree, new)
+
+        with patch("gramps_webapi.auth._update_tree_usage_ai", side_effect=update):
+            self.assertEqual(_increment_tree_usage_ai("conflict", 2), 7)
+        self.assertEqual(get_tree_usage("conflict")["usage_ai"], 7)